@@ -0,0 +1,111 @@
+import argparse
+import multiprocessing
+import sys
+import time
+from solver import SOLVED, Sudoku
+from storage import PuzzleCollection, is_collection
+
+
+def read_puzzles(file):
+    '''Yields every puzzle line in a file, skipping blank lines and # comments.'''
+    for line in file:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def solve_puzzle(puzzle, engine='bitmask', timeout=None, max_nodes=None):
+    '''
+    Solves one puzzle string. Returns the solution as a string and True, or
+    the puzzle unchanged and False if it is invalid, unsolvable or ran out
+    of budget.
+    '''
+    try:
+        game = Sudoku.from_string(puzzle)
+    except ValueError:
+        return puzzle, False
+    if timeout is None and max_nodes is None:
+        solved = game.solve(engine)
+    else:
+        solved = game.solve_within(engine, timeout, max_nodes) == SOLVED
+    if not solved:
+        return puzzle, False
+    return game.to_string(), True
+
+
+def _solve_task(task):
+    '''Unpacks a (puzzle, engine, timeout, max_nodes) tuple for the process pool.'''
+    return solve_puzzle(*task)
+
+
+def solve_file(infile, outfile, workers=None, chunksize=64, engine='bitmask',
+               timeout=None, max_nodes=None):
+    '''
+    Solves every puzzle in infile across a process pool and writes the
+    solutions to outfile in input order. Each puzzle may be limited to timeout
+    seconds and max_nodes search nodes. Returns the number of puzzles solved
+    and the number left unsolved.
+    '''
+    solved = unsolved = 0
+    tasks = ((puzzle, engine, timeout, max_nodes) for puzzle in read_puzzles(infile))
+    with multiprocessing.Pool(workers) as pool:
+        for solution, success in pool.imap(_solve_task, tasks, chunksize):
+            outfile.write(solution + '\n')
+            if success:
+                solved += 1
+            else:
+                unsolved += 1
+    return solved, unsolved
+
+
+def main(argv=None):
+    '''Command line entry point for solving a file of puzzles.'''
+    parser = argparse.ArgumentParser(
+        description='Solve a file of Sudoku puzzle strings, one per line.'
+    )
+    parser.add_argument('input', help="puzzle file or collection, use '-' for stdin")
+    parser.add_argument('-o', '--output', default='-',
+                        help="solution file, use '-' for stdout (default)")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='number of worker processes (default: all cores)')
+    parser.add_argument('-c', '--chunksize', type=int, default=64,
+                        help='puzzles sent to a worker at a time (default: 64)')
+    parser.add_argument('-e', '--engine', default='bitmask',
+                        choices=['bitmask', 'dlx', 'backtrack'],
+                        help='solver engine to use (default: bitmask)')
+    parser.add_argument('-t', '--timeout', type=float, default=None,
+                        help='give up on a puzzle after this many seconds')
+    parser.add_argument('-n', '--max-nodes', type=int, default=None,
+                        help='give up on a puzzle after this many search nodes')
+    args = parser.parse_args(argv)
+
+    if args.input == '-':
+        infile = sys.stdin
+    elif is_collection(args.input):
+        infile = PuzzleCollection(args.input)
+    else:
+        infile = open(args.input)
+    outfile = sys.stdout if args.output == '-' else open(args.output, 'w')
+    start = time.perf_counter()
+    try:
+        solved, unsolved = solve_file(
+            infile, outfile, args.workers, args.chunksize, args.engine,
+            args.timeout, args.max_nodes
+        )
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+    elapsed = time.perf_counter() - start
+
+    total = solved + unsolved
+    rate = total / elapsed if elapsed else 0
+    print(
+        f'Solved {solved} of {total} puzzles in {elapsed:.2f}s ({rate:.1f} puzzles/sec)',
+        file=sys.stderr
+    )
+
+
+if __name__ == '__main__':
+    main()
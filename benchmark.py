@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from instrumentation import instrumented_solve
+from solver import Sudoku
+
+
+# Corpora bundled in the benchmarks directory
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks')
+CORPORA = ('easy', 'hard', 'minimal17', 'adversarial')
+
+# The reference backtracker can take minutes on the harder corpora so it only runs if asked for
+DEFAULT_ENGINES = ('bitmask', 'dlx')
+ENGINES = ('bitmask', 'dlx', 'backtrack')
+
+# Code run in a fresh interpreter to time the cold start of each path. The
+# solver path must not load pygame and the GUI path ends with the window open
+STARTUP_PATHS = {
+    'solver': (
+        'import sys, layout, solver\n'
+        'solver.Sudoku.from_string("." * 81)\n'
+        'assert "pygame" not in sys.modules, "the solver path imported pygame"'
+    ),
+    'gui': (
+        'import sudoku\n'
+        'sudoku.open_window()\n'
+        'sudoku.glyphs.ensure(sudoku.cell_size, sudoku.digit_colors)'
+    ),
+}
+
+# Cold start targets in seconds, including the interpreter's own startup
+STARTUP_TARGETS = {'solver': 0.1, 'gui': 0.75}
+
+
+def load_corpus(name):
+    '''Returns the puzzle strings of a bundled corpus.'''
+    with open(os.path.join(CORPUS_DIR, f'{name}.txt')) as file:
+        return [line.strip() for line in file if line.strip() and not line.startswith('#')]
+
+
+def measure(engine, puzzle, repeat=1):
+    '''
+    Returns the best wall time over repeat runs, the search stats and the
+    peak memory allocated while solving a puzzle with an engine.
+    '''
+    best = None
+    for _ in range(repeat):
+        game = Sudoku.from_string(puzzle)
+        start = time.perf_counter()
+        solved = game.solve(engine)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    # Memory and search stats come from separate runs so they do not skew the timings
+    tracemalloc.start()
+    Sudoku.from_string(puzzle).solve(engine)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = instrumented_solve(Sudoku.from_string(puzzle), engine)
+
+    return {
+        'solved': solved,
+        'time': best,
+        'nodes': stats.nodes,
+        'backtracks': stats.backtracks,
+        'max_depth': stats.max_depth,
+        'peak_memory': peak,
+    }
+
+
+def measure_startup(path, repeat=5):
+    '''
+    Returns the best wall time over repeat runs of starting a new interpreter
+    and running the code of a startup path. The GUI path uses the dummy video
+    driver unless another one is set, so it also runs without a display.
+    '''
+    env = dict(os.environ)
+    env.setdefault('SDL_VIDEODRIVER', 'dummy')
+    env.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', STARTUP_PATHS[path]], cwd=os.path.dirname(CORPUS_DIR),
+                       env=env, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_benchmarks(engines=DEFAULT_ENGINES, corpora=CORPORA, repeat=1, progress=None):
+    '''Runs every engine over every corpus and returns the results as a dictionary.'''
+    results = []
+    summary = {}
+    for engine in engines:
+        summary[engine] = {}
+        for corpus in corpora:
+            total = {'puzzles': 0, 'solved': 0, 'time': 0.0, 'nodes': 0, 'peak_memory': 0}
+            for number, puzzle in enumerate(load_corpus(corpus)):
+                result = measure(engine, puzzle, repeat)
+                results.append(dict(engine=engine, corpus=corpus, puzzle=number, **result))
+
+                total['puzzles'] += 1
+                total['solved'] += result['solved']
+                total['time'] += result['time']
+                total['nodes'] += result['nodes']
+                total['peak_memory'] = max(total['peak_memory'], result['peak_memory'])
+            summary[engine][corpus] = total
+            if progress is not None:
+                progress(engine, corpus, total)
+    return {'results': results, 'summary': summary}
+
+
+def compare(current, baseline, threshold=1.25):
+    '''
+    Compares the summaries of two benchmark runs. Returns a list of messages
+    for every engine and corpus whose time, nodes or peak memory grew by more
+    than threshold times, or that solved fewer puzzles.
+    '''
+    regressions = []
+    for engine, corpora in current['summary'].items():
+        for corpus, total in corpora.items():
+            base = baseline['summary'].get(engine, {}).get(corpus)
+            if base is None:
+                continue
+            if total['solved'] < base['solved']:
+                regressions.append(
+                    f'{engine}/{corpus}: solved {total["solved"]} puzzles, baseline {base["solved"]}'
+                )
+            for metric in ('time', 'nodes', 'peak_memory'):
+                if base[metric] and total[metric] > base[metric] * threshold:
+                    regressions.append(
+                        f'{engine}/{corpus}: {metric} {total[metric]:.6g}, '
+                        f'baseline {base[metric]:.6g} ({total[metric] / base[metric]:.2f}x)'
+                    )
+    return regressions
+
+
+def main(argv=None):
+    '''Command line entry point for running the benchmarks.'''
+    parser = argparse.ArgumentParser(description='Benchmark the solver engines on the bundled corpora.')
+    parser.add_argument('-e', '--engines', nargs='+', default=list(DEFAULT_ENGINES), choices=ENGINES,
+                        help='engines to run (default: bitmask dlx)')
+    parser.add_argument('-c', '--corpora', nargs='+', default=list(CORPORA), choices=CORPORA,
+                        help='corpora to run (default: all)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='timed runs per puzzle, the best is kept (default: 3)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='write the results as JSON to this file')
+    parser.add_argument('-b', '--baseline', default=None,
+                        help='JSON results of an earlier run to compare against')
+    parser.add_argument('-t', '--threshold', type=float, default=1.25,
+                        help='slowdown ratio counted as a regression (default: 1.25)')
+    parser.add_argument('--startup', action='store_true',
+                        help='time the cold start of the solver and GUI paths against their targets instead')
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        missed = False
+        for path, target in STARTUP_TARGETS.items():
+            elapsed = measure_startup(path, args.repeat)
+            status = 'ok' if elapsed <= target else 'MISSED'
+            missed = missed or elapsed > target
+            print(f'{path:<10} {elapsed:>8.3f}s cold start, target {target:.3f}s {status}', file=sys.stderr)
+        if missed:
+            sys.exit(1)
+        return
+
+    def progress(engine, corpus, total):
+        print(
+            f'{engine:<10} {corpus:<12} {total["solved"]:>3}/{total["puzzles"]:<3} solved '
+            f'{total["time"]:>10.4f}s {total["nodes"]:>10} nodes {total["peak_memory"] / 1024:>9.1f} KiB peak',
+            file=sys.stderr
+        )
+
+    current = run_benchmarks(args.engines, args.corpora, args.repeat, progress)
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(current, file, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(current, baseline, args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION {regression}', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print('No regressions against the baseline', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+from collections import OrderedDict
+import sqlite3
+from canonical import canonicalize
+from solver import Sudoku, grid_to_string
+
+
+# Grids with fewer clues have many solutions and so many symmetries that
+# finding their canonical form costs more than solving them
+MIN_CLUES = 17
+
+
+class SolutionCache:
+    '''
+    Caches solutions by the canonical form of their puzzle, so a puzzle that
+    was seen before in any orientation or labelling is answered by a lookup.
+    Recently used entries are kept in memory and evicted least recently used
+    first. If a path is given every entry is also stored in an sqlite file.
+    '''
+
+    def __init__(self, capacity=10000, path=None, engine='bitmask'):
+        '''Initializes a cache holding up to capacity entries in memory.'''
+        self.capacity = capacity
+        self.engine = engine
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path)
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS solutions (puzzle TEXT PRIMARY KEY, solution TEXT)'
+            )
+
+    def _lookup(self, key):
+        '''Returns the cached solution string for a canonical puzzle, or None.'''
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        if self.db is not None:
+            row = self.db.execute(
+                'SELECT solution FROM solutions WHERE puzzle = ?', (key,)
+            ).fetchone()
+            if row is not None:
+                self._remember(key, row[0])
+                return row[0]
+        return None
+
+    def _remember(self, key, solution):
+        '''Stores a solution string in memory, evicting the oldest entry if full.'''
+        self.entries[key] = solution
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def solve(self, grid):
+        '''
+        Returns the solution of a flat grid of 81 values as a flat list, or
+        None if it is not solvable. Unsolvable puzzles are cached as well.
+        Boards of other sizes have no canonical form and, like grids with
+        fewer than MIN_CLUES clues, are solved directly.
+        '''
+        if len(grid) != 81 or sum(1 for value in grid if value) < MIN_CLUES:
+            values = bytes(value or 0 for value in grid)
+            return Sudoku._from_buffers(values, values)._find_solution(self.engine)
+
+        canonical, transform = canonicalize(grid)
+        key = grid_to_string(canonical)
+
+        solution = self._lookup(key)
+        if solution is None:
+            self.misses += 1
+            found = Sudoku.from_string(key)._find_solution(self.engine)
+            solution = grid_to_string(found) if found is not None else ''
+            self._remember(key, solution)
+            if self.db is not None:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO solutions VALUES (?, ?)', (key, solution)
+                )
+        else:
+            self.hits += 1
+
+        if not solution:
+            return None
+        return transform.invert([int(char) for char in solution])
+
+    def solve_game(self, game):
+        '''Solves a Sudoku game through the cache. Returns True if successful.'''
+        solution = self.solve(game.values)
+        if solution is None:
+            return False
+        game._assign(solution)
+        return True
+
+    def flush(self):
+        '''Commits the entries written to the sqlite file.'''
+        if self.db is not None:
+            self.db.commit()
+
+    def close(self):
+        '''Commits and closes the sqlite file.'''
+        if self.db is not None:
+            self.db.commit()
+            self.db.close()
+            self.db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,175 @@
+from collections import namedtuple
+from functools import lru_cache
+from itertools import permutations
+
+
+# Most tied states kept after every row, in total over all choices of rows.
+# Only reached by sparse or very symmetric grids, whose result is then not
+# fully canonical
+MAX_STATES = 5000
+
+
+class Transform(namedtuple('Transform', ['transpose', 'rows', 'cols', 'digits'])):
+    '''
+    A symmetry of the Sudoku grid. The grid is transposed first if transpose
+    is True, then row r of the result is taken from row rows[r], column c
+    from column cols[c], and every digit d is relabelled to digits[d].
+    '''
+
+    __slots__ = ()
+
+    def apply(self, grid):
+        '''Returns a flat list of 81 values with the transform applied.'''
+        if self.transpose:
+            grid = [grid[col * 9 + row] for row in range(9) for col in range(9)]
+        digits = self.digits
+        return [digits[grid[row * 9 + col]] for row in self.rows for col in self.cols]
+
+    def invert(self, grid):
+        '''Returns a flat list of 81 values with the transform undone.'''
+        inverse = [0] * 10
+        for digit, label in enumerate(self.digits):
+            inverse[label] = digit
+        result = [0] * 81
+        for position, row in enumerate(self.rows):
+            for offset, col in enumerate(self.cols):
+                result[row * 9 + col] = inverse[grid[position * 9 + offset]]
+        if self.transpose:
+            result = [result[col * 9 + row] for row in range(9) for col in range(9)]
+        return result
+
+
+@lru_cache(maxsize=None)
+def _column_orders():
+    '''
+    Returns the 1296 column orders allowed by Sudoku, stacks in any order and
+    columns in any order within their stack, each with the bit value a clue
+    in every source column adds to a row pattern in that order.
+    '''
+    orders = []
+    inner = list(permutations(range(3)))
+    for stacks in permutations(range(3)):
+        for first in inner:
+            for second in inner:
+                for third in inner:
+                    within = (first, second, third)
+                    cols = tuple(stacks[i] * 3 + within[i][k] for i in range(3) for k in range(3))
+                    shifts = [0] * 9
+                    for position, col in enumerate(cols):
+                        shifts[col] = 1 << (8 - position)
+                    orders.append((cols, tuple(shifts)))
+    return orders
+
+
+@lru_cache(maxsize=None)
+def _best_orders(clues):
+    '''
+    Returns the smallest pattern a row with clues in the given columns can
+    have and the indices of the column orders that give it.
+    '''
+    best = None
+    indices = []
+    for index, (_, shifts) in enumerate(_column_orders()):
+        value = sum(shifts[col] for col in clues)
+        if best is None or value < best:
+            best = value
+            indices = []
+        if value == best:
+            indices.append(index)
+    return best, tuple(indices)
+
+
+def _relabel(grid):
+    '''
+    Returns the digit map that numbers the digits of a grid in the order they
+    first appear, with the unused digits following in increasing order.
+    '''
+    digits = [0] * 10
+    label = 0
+    for value in grid:
+        if value and not digits[value]:
+            label += 1
+            digits[value] = label
+    for value in range(1, 10):
+        if not digits[value]:
+            label += 1
+            digits[value] = label
+    return tuple(digits)
+
+
+def canonicalize(grid):
+    '''
+    Maps a flat grid of 81 values, with 0 for empty cells, to the
+    representative of its symmetry class under transposition, band, stack,
+    row and column permutations and digit relabelling.
+    Returns the canonical grid and the Transform that produces it.
+
+    The representative has the smallest pattern of clues read row by row and,
+    among the transforms giving that pattern, the smallest relabelled digits.
+    Nearly empty grids tie on too many transforms to try them all, so only
+    MAX_STATES are kept after every row. Their result is still the grid
+    transformed, but other forms of the same grid may give another one.
+    '''
+    grid = [value or 0 for value in grid]
+    orders = _column_orders()
+
+    # Columns holding a clue in every row of both orientations
+    clues = (
+        [tuple(col for col in range(9) if grid[row * 9 + col]) for row in range(9)],
+        [tuple(row for row in range(9) if grid[row * 9 + col]) for col in range(9)],
+    )
+
+    # The first row can be any row of either orientation. Tied states are
+    # grouped by their rows as (transpose, rows) -> column order indices
+    best = None
+    states = {}
+    for transpose in (0, 1):
+        for row in range(9):
+            value, indices = _best_orders(clues[transpose][row])
+            if best is None or value < best:
+                best = value
+                states = {}
+            if value == best:
+                states[transpose, (row,)] = indices
+
+    # Every later row keeps the band structure and is added where it gives the smallest pattern
+    for level in range(1, 9):
+        best = None
+        next_states = {}
+        count = 0
+        for (transpose, rows), indices in states.items():
+            if level % 3:
+                band = rows[-1] // 3
+                candidates = [band * 3 + i for i in range(3) if band * 3 + i not in rows]
+            else:
+                used = {row // 3 for row in rows}
+                candidates = [band * 3 + i for band in range(3) if band not in used for i in range(3)]
+
+            for row in candidates:
+                cols = clues[transpose][row]
+                for index in indices:
+                    shifts = orders[index][1]
+                    value = 0
+                    for col in cols:
+                        value += shifts[col]
+                    if best is None or value < best:
+                        best = value
+                        next_states = {}
+                        count = 0
+                    if value == best and count < MAX_STATES:
+                        next_states.setdefault((transpose, rows + (row,)), []).append(index)
+                        count += 1
+        states = next_states
+
+    # Break the remaining ties with the relabelled digits
+    identity = tuple(range(10))
+    result = None
+    for (transpose, rows), indices in states.items():
+        for index in indices:
+            transform = Transform(bool(transpose), rows, orders[index][0], identity)
+            placed = transform.apply(grid)
+            digits = _relabel(placed)
+            candidate = [digits[value] for value in placed]
+            if result is None or candidate < result[0]:
+                result = (candidate, transform._replace(digits=digits))
+    return result
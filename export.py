@@ -0,0 +1,188 @@
+import argparse
+import os
+import sys
+import pygame
+import sudoku
+from batch_solve import read_puzzles
+from solver import Sudoku
+
+
+def render_solve(game, speed=1, max_frames=None):
+    '''
+    Yields the frames of a visual solve of game drawn on an offscreen
+    pygame.Surface the size of the game window, taking speed steps between
+    frames. Once max_frames - 1 frames have been drawn the solve skips to the
+    end so the last frame shows the result. The same surface is yielded
+    every time, so save or copy it before taking the next frame.
+    '''
+    pygame.font.init()
+    box = game.topology.box
+    peers = game.topology.peers
+    surface = pygame.Surface(sudoku.size)
+    renderer = sudoku.DirtyRenderer(surface, box)
+    grid = sudoku.geometry(box)
+    cells = grid.cells
+    sudoku.glyphs.ensure(grid.cell_size, sudoku.digit_colors, game.topology.size)
+
+    # Only the cells changed since the previous frame are redrawn
+    changed_cells = set(range(game.topology.cells))
+
+    def listener(index, old, new):
+        changed_cells.update(peers[index], (index,))
+
+    game.subscribe(listener)
+    solving = sudoku.VisualSolve(game)
+    solving.speed = speed
+    drawn_highlight = None
+    frames = 0
+    try:
+        while True:
+            highlight = solving.highlight
+            for marked in (drawn_highlight, highlight):
+                if marked is not None:
+                    changed_cells.add(marked[0])
+            drawn_highlight = highlight
+
+            renderer.begin()
+            sudoku.draw_cells(renderer, cells, game, changed_cells, highlight=highlight)
+            changed_cells.clear()
+            sudoku.draw_buttons(renderer, {
+                'solve': 'Visual Solve' if solving.done else 'Cancel',
+                'reset': 'Reset',
+                'hint': 'Hint',
+            })
+            sudoku.draw_status_strip(renderer, game)
+            renderer.flush()
+            yield surface
+
+            frames += 1
+            if solving.done:
+                return
+            if max_frames is not None and frames >= max_frames - 1:
+                solving.skip()
+            else:
+                solving.update()
+    finally:
+        game.unsubscribe(listener)
+        if not solving.done:
+            solving.finish()
+
+
+def save_frames(frames, directory):
+    '''Saves every frame as a numbered PNG file in directory. Returns the number of frames.'''
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    for frame in frames:
+        pygame.image.save(frame, os.path.join(directory, f'frame_{count:05d}.png'))
+        count += 1
+    return count
+
+
+def _swatch(first):
+    '''
+    Returns a surface holding the first frame and a strip of the colors and
+    glyphs a solve adds to later frames, to build the palette of a GIF from.
+    '''
+    swatch = pygame.Surface((first.get_width(), first.get_height() + sudoku.cell_size))
+    swatch.fill(sudoku.white)
+    swatch.blit(first, (0, 0))
+    left = 0
+    top = first.get_height()
+    colors = list(sudoku.digit_colors.values()) + [sudoku.green, sudoku.red, sudoku.blue]
+    for color in colors:
+        swatch.fill(color, (left, top, 10, 10))
+        left += 10
+    glyphs = [glyph for (_, style), glyph in sudoku.glyphs.digits.items() if style == 'valid']
+    glyphs.append(sudoku.glyphs.text('Solved!', sudoku.green, status=True))
+    for glyph in glyphs:
+        if left + glyph.get_width() > swatch.get_width():
+            break
+        swatch.blit(glyph, (left, top))
+        left += glyph.get_width()
+    return swatch
+
+
+def save_gif(frames, path, fps=20, hold=2.0):
+    '''
+    Saves the frames as a looping GIF played at fps frames per second, with
+    the last frame held for hold seconds. Returns the number of frames.
+    Requires Pillow.
+    '''
+    try:
+        from PIL import Image
+    except ImportError:
+        raise ImportError('Saving a GIF requires Pillow, install it with pip install Pillow.')
+
+    def to_image(surface):
+        return Image.frombytes('RGB', surface.get_size(), pygame.image.tostring(surface, 'RGB'))
+
+    # Building a palette for every frame is slow, so all frames share one
+    # built from the first and are mapped to it without dithering
+    images = []
+    palette = None
+    for frame in frames:
+        if palette is None:
+            palette = to_image(_swatch(frame)).quantize(method=Image.FASTOCTREE)
+        images.append(to_image(frame).quantize(palette=palette, dither=Image.NONE))
+    if not images:
+        return 0
+
+    durations = [round(1000 / fps)] * len(images)
+    durations[-1] = max(durations[-1], round(hold * 1000))
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    images[0].save(path, save_all=True, append_images=images[1:], duration=durations, loop=0)
+    return len(images)
+
+
+def export_solve(game, output, fps=20, speed=1, max_frames=None, hold=2.0):
+    '''
+    Exports a visual solve of game to output, a GIF if the path ends in .gif
+    and a directory of PNG frames otherwise. Returns the number of frames.
+    '''
+    frames = render_solve(game, speed, max_frames)
+    if output.lower().endswith('.gif'):
+        return save_gif(frames, output, fps, hold)
+    return save_frames(frames, output)
+
+
+def main(argv=None):
+    '''Command line entry point for exporting solve animations.'''
+    parser = argparse.ArgumentParser(
+        description='Export visual solves as GIFs or PNG frames without a display.'
+    )
+    parser.add_argument('puzzles',
+                        help='a puzzle string or a file with one puzzle per line')
+    parser.add_argument('-o', '--output', required=True,
+                        help='GIF path or frame directory for a puzzle string, '
+                             'output directory for a file of puzzles')
+    parser.add_argument('-f', '--format', choices=('gif', 'png'), default='gif',
+                        help='output format for a file of puzzles (default: gif)')
+    parser.add_argument('-r', '--fps', type=float, default=sudoku.VisualSolve.fps,
+                        help=f'frames per second of the GIFs (default: {sudoku.VisualSolve.fps})')
+    parser.add_argument('-s', '--speed', type=int, default=1,
+                        help='solve steps per frame (default: 1)')
+    parser.add_argument('-m', '--max-frames', type=int, default=None,
+                        help='skip to the solution after this many frames')
+    parser.add_argument('--hold', type=float, default=2.0,
+                        help='seconds the last GIF frame is shown (default: 2)')
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.puzzles):
+        count = export_solve(Sudoku.from_string(args.puzzles), args.output, args.fps,
+                             args.speed, args.max_frames, args.hold)
+        print(f'{count} frames written to {args.output}', file=sys.stderr)
+        return
+
+    with open(args.puzzles) as file:
+        for number, puzzle in enumerate(read_puzzles(file)):
+            name = f'{number:05d}.gif' if args.format == 'gif' else f'{number:05d}'
+            output = os.path.join(args.output, name)
+            count = export_solve(Sudoku.from_string(puzzle), output, args.fps,
+                                 args.speed, args.max_frames, args.hold)
+            print(f'{count} frames written to {output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
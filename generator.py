@@ -0,0 +1,145 @@
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+from logic import DIFFICULTIES, grade
+from solver import BitmaskSolver, DancingLinks, grid_to_string
+
+
+def generate_solution(rng=None):
+    '''Returns a random complete grid as a flat list of 81 values.'''
+    solver = BitmaskSolver([0] * 81, rng=rng or random.Random())
+    solver.solve()
+    return solver.grid
+
+
+def generate_puzzle(difficulty=None, rng=None, symmetric=True):
+    '''
+    Returns a random puzzle with a unique solution as a flat list of 81 values.
+    Clues are removed from a random grid as long as the solution stays unique
+    and, if a difficulty is given, the puzzle does not become harder than it.
+    '''
+    rng = rng or random.Random()
+    limit = DIFFICULTIES.index(difficulty) if difficulty is not None else None
+    puzzle = generate_solution(rng)
+
+    order = list(range(81))
+    rng.shuffle(order)
+    for index in order:
+        if not puzzle[index]:
+            continue
+
+        # Remove the clue and its rotational partner together
+        cells = {index, 80 - index} if symmetric else {index}
+        removed = [(cell, puzzle[cell]) for cell in cells]
+        for cell in cells:
+            puzzle[cell] = 0
+
+        if (
+            DancingLinks(puzzle).count_solutions(limit=2) != 1
+            or limit is not None and DIFFICULTIES.index(grade(puzzle)) > limit
+        ):
+            for cell, value in removed:
+                puzzle[cell] = value
+
+    return puzzle
+
+
+def generate(difficulty, rng=None, attempts=100):
+    '''
+    Returns a puzzle graded exactly as difficulty.
+    Raises RuntimeError if none is found within the given number of attempts.
+    '''
+    if difficulty not in DIFFICULTIES:
+        raise ValueError(f'Unknown difficulty: {difficulty}')
+    rng = rng or random.Random()
+    for _ in range(attempts):
+        puzzle = generate_puzzle(difficulty, rng)
+        if grade(puzzle) == difficulty:
+            return puzzle
+    raise RuntimeError(f'No {difficulty} puzzle found in {attempts} attempts')
+
+
+def _generate_task(task):
+    '''Generates one puzzle string for the process pool from a (difficulty, seed) pair.'''
+    difficulty, seed = task
+    return grid_to_string(generate(difficulty, random.Random(seed)))
+
+
+def generate_pool(outfile, count, difficulty, workers=None, seed=None):
+    '''
+    Generates count puzzles of a difficulty across a process pool and writes
+    each one to outfile as soon as it is ready.
+    '''
+    seeds = random.Random(seed)
+    tasks = ((difficulty, seeds.getrandbits(64)) for _ in range(count))
+    with multiprocessing.Pool(workers) as pool:
+        for puzzle in pool.imap_unordered(_generate_task, tasks):
+            outfile.write(puzzle + '\n')
+            outfile.flush()
+
+
+class PuzzlePool:
+    '''
+    Serves pre-generated puzzles from a directory holding one
+    <difficulty>.txt file of puzzle strings per difficulty.
+    '''
+
+    def __init__(self, directory='pools', rng=None):
+        '''Initializes a pool reading from directory.'''
+        self.directory = directory
+        self.rng = rng or random.Random()
+        self._puzzles = {}
+
+    def path(self, difficulty):
+        '''Returns the path of the pool file for a difficulty.'''
+        return os.path.join(self.directory, f'{difficulty}.txt')
+
+    def take(self, difficulty):
+        '''
+        Returns a puzzle string of a difficulty that has not been served yet.
+        Falls back to generating one if the pool is missing or used up.
+        '''
+        if difficulty not in self._puzzles:
+            try:
+                with open(self.path(difficulty)) as file:
+                    self._puzzles[difficulty] = [line.strip() for line in file if line.strip()]
+            except FileNotFoundError:
+                self._puzzles[difficulty] = []
+
+        puzzles = self._puzzles[difficulty]
+        if puzzles:
+            # Swap a random puzzle to the end so it can be popped cheaply
+            index = self.rng.randrange(len(puzzles))
+            puzzles[index], puzzles[-1] = puzzles[-1], puzzles[index]
+            return puzzles.pop()
+        return grid_to_string(generate(difficulty, self.rng))
+
+
+def main(argv=None):
+    '''Command line entry point for pre-generating puzzle pools.'''
+    parser = argparse.ArgumentParser(description='Pre-generate a pool of Sudoku puzzles.')
+    parser.add_argument('difficulty', choices=DIFFICULTIES)
+    parser.add_argument('-n', '--count', type=int, default=100,
+                        help='number of puzzles to generate (default: 100)')
+    parser.add_argument('-o', '--output', default=None,
+                        help="output file, use '-' for stdout (default: pools/<difficulty>.txt)")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='number of worker processes (default: all cores)')
+    parser.add_argument('-s', '--seed', type=int, default=None,
+                        help='seed for reproducible pools')
+    args = parser.parse_args(argv)
+
+    if args.output == '-':
+        generate_pool(sys.stdout, args.count, args.difficulty, args.workers, args.seed)
+        return
+
+    path = args.output or PuzzlePool().path(args.difficulty)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as outfile:
+        generate_pool(outfile, args.count, args.difficulty, args.workers, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+from array import array
+from contextlib import contextmanager
+import struct
+from solver import Sudoku
+
+
+# A change of one cell: index, old value and new value
+DELTA = struct.Struct('<HBB')
+
+# Saved histories start with the magic bytes, the number of cells, the
+# number of entries and the position reached
+HEADER = struct.Struct('<4sHII')
+MAGIC = b'SDH1'
+
+
+class History:
+    '''
+    Records every change made to a game so it can be undone and redone.
+    Each entry is one move, or a group of changes such as a reset, stored as
+    packed (index, old, new) deltas of 4 bytes each. A copy of the board is
+    kept every snapshot_interval entries, so jumping to any entry replays at
+    most that many entries.
+    '''
+
+    def __init__(self, game, snapshot_interval=64):
+        '''Starts recording the changes made to game from its current state.'''
+        self.game = game
+        self.givens = game.givens
+        self.snapshot_interval = snapshot_interval
+        self.position = 0
+        self._deltas = bytearray()
+        self._ends = array('I')
+        self._snapshots = [game.snapshot()]
+        self._depth = 0
+        self._open = False
+        self._replaying = False
+        game.subscribe(self._record)
+
+    def __len__(self):
+        '''Returns the number of entries, including the ones that were undone.'''
+        return len(self._ends)
+
+    def close(self):
+        '''Stops recording the changes made to the game.'''
+        self.game.unsubscribe(self._record)
+
+    def _bounds(self, entry):
+        '''Returns the start and end offsets of the deltas of an entry.'''
+        return self._ends[entry - 1] if entry else 0, self._ends[entry]
+
+    def _record(self, index, old, new):
+        '''Appends a change to the open entry, or to a new one.'''
+        if self._replaying:
+            return
+        if not self._open:
+            # A new move drops the entries that were undone
+            if self.position < len(self._ends):
+                del self._deltas[self._bounds(self.position)[0]:]
+                del self._ends[self.position:]
+                del self._snapshots[self.position // self.snapshot_interval + 1:]
+            self._ends.append(len(self._deltas))
+            self.position += 1
+            self._open = self._depth > 0
+        self._deltas += DELTA.pack(index, old, new)
+        self._ends[-1] = len(self._deltas)
+        if not self._open:
+            self._close_entry()
+
+    def _close_entry(self):
+        '''Finishes the last entry, taking a snapshot if one is due.'''
+        due, early = divmod(self.position, self.snapshot_interval)
+        if not early and len(self._snapshots) == due:
+            self._snapshots.append(self.game.snapshot())
+
+    def _compact(self):
+        '''
+        Merges the changes of the last entry to one delta per cell, from its
+        first old value to its last new value, and drops the entry if nothing
+        changed in the end.
+        '''
+        start, end = self._bounds(self.position - 1)
+        changes = {}
+        for index, old, new in DELTA.iter_unpack(self._deltas[start:end]):
+            changes[index] = (changes[index][0] if index in changes else old, new)
+        del self._deltas[start:]
+        for index, (old, new) in changes.items():
+            if old != new:
+                self._deltas += DELTA.pack(index, old, new)
+        if len(self._deltas) == start:
+            self._ends.pop()
+            self.position -= 1
+        else:
+            self._ends[-1] = len(self._deltas)
+
+    def begin(self):
+        '''Starts a group, recording every change until the matching end as one entry.'''
+        self._depth += 1
+
+    def end(self):
+        '''Ends a group started with begin.'''
+        self._depth -= 1
+        if not self._depth and self._open:
+            self._open = False
+            self._compact()
+            self._close_entry()
+
+    @contextmanager
+    def group(self):
+        '''Records the changes made inside the with block as one entry.'''
+        self.begin()
+        try:
+            yield
+        finally:
+            self.end()
+
+    def _apply(self, entry, undo):
+        '''Applies the deltas of an entry to the game, or takes them back.'''
+        start, end = self._bounds(entry)
+        deltas = list(DELTA.iter_unpack(self._deltas[start:end]))
+        if undo:
+            deltas.reverse()
+        for index, old, new in deltas:
+            self.game.set_value(index, old if undo else new)
+
+    def can_undo(self):
+        '''Returns whether there is an entry to undo.'''
+        return self.position > 0 and not self._depth
+
+    def can_redo(self):
+        '''Returns whether there is an undone entry to redo.'''
+        return self.position < len(self._ends) and not self._depth
+
+    def undo(self):
+        '''Takes back the last entry. Returns whether there was one.'''
+        if not self.can_undo():
+            return False
+        self.goto(self.position - 1)
+        return True
+
+    def redo(self):
+        '''Applies the last undone entry again. Returns whether there was one.'''
+        if not self.can_redo():
+            return False
+        self.goto(self.position + 1)
+        return True
+
+    def goto(self, position):
+        '''
+        Puts the game in the state it had after the given number of entries.
+        Far jumps restore the nearest snapshot before the position first.
+        '''
+        position = max(0, min(position, len(self._ends)))
+        self._replaying = True
+        try:
+            if abs(position - self.position) > self.snapshot_interval:
+                snapshot = position // self.snapshot_interval
+                self.game.restore(self._snapshots[snapshot])
+                self.position = snapshot * self.snapshot_interval
+            while self.position > position:
+                self.position -= 1
+                self._apply(self.position, undo=True)
+            while self.position < position:
+                self._apply(self.position, undo=False)
+                self.position += 1
+        finally:
+            self._replaying = False
+
+    def entries(self):
+        '''Yields every entry as a tuple of (index, old, new) changes.'''
+        for entry in range(len(self._ends)):
+            start, end = self._bounds(entry)
+            yield tuple(DELTA.iter_unpack(self._deltas[start:end]))
+
+    def to_bytes(self):
+        '''
+        Returns the history as bytes: a header, the givens and starting
+        values of the game, the end offset of every entry and the deltas.
+        '''
+        return b''.join((
+            HEADER.pack(MAGIC, len(self.givens), len(self._ends), self.position),
+            self.givens,
+            self._snapshots[0],
+            struct.pack(f'<{len(self._ends)}I', *self._ends),
+            self._deltas,
+        ))
+
+    @classmethod
+    def from_bytes(cls, data, snapshot_interval=64):
+        '''
+        Creates a game at the starting state of a saved history and a History
+        that can replay it, moved to the position it was saved at.
+        Returns the game and the history.
+        '''
+        try:
+            magic, cells, count, position = HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError('Data is too short to be a saved history.')
+        if magic != MAGIC:
+            raise ValueError('Data is not a saved history.')
+        offset = HEADER.size
+        givens = bytes(data[offset:offset + cells])
+        values = bytes(data[offset + cells:offset + cells * 2])
+        offset += cells * 2
+        try:
+            ends = array('I', struct.unpack_from(f'<{count}I', data, offset))
+        except struct.error:
+            raise ValueError('Saved history is corrupted.')
+        deltas = bytearray(data[offset + count * 4:])
+        if (ends[-1] if ends else 0) != len(deltas) or len(deltas) % DELTA.size or position > count:
+            raise ValueError('Saved history is corrupted.')
+
+        game = Sudoku._from_buffers(values, givens)
+        size = game.topology.size
+        for index, old, new in DELTA.iter_unpack(deltas):
+            if index >= cells or old > size or new > size:
+                raise ValueError('Saved history is corrupted.')
+        history = cls(game, snapshot_interval)
+        history._ends = ends
+        history._deltas = deltas
+        history._rebuild_snapshots()
+        history.goto(position)
+        return game, history
+
+    def _rebuild_snapshots(self):
+        '''Recomputes the snapshots by replaying every entry from the start.'''
+        position = self.position
+        self.goto(0)
+        snapshots = self._snapshots[:1]
+        self._replaying = True
+        try:
+            for entry in range(len(self._ends)):
+                self._apply(entry, undo=False)
+                if (entry + 1) % self.snapshot_interval == 0:
+                    snapshots.append(self.game.snapshot())
+            self.position = len(self._ends)
+        finally:
+            self._replaying = False
+        self._snapshots = snapshots
+        self.goto(position)
@@ -0,0 +1,183 @@
+import time
+from solver import BitmaskSolver, DancingLinks, Sudoku
+
+
+class SolveStats:
+    '''
+    Counters and timings collected by an instrumented solve.
+    Times are in seconds and phases are only timed by the engines that have them.
+    '''
+
+    fields = (
+        'engine', 'solved', 'nodes', 'backtracks', 'max_depth', 'propagations',
+        'select_time', 'check_time', 'undo_time', 'total_time',
+    )
+
+    def __init__(self, engine):
+        '''Initializes empty stats for a solve with engine.'''
+        self.engine = engine
+        self.solved = False
+        self.nodes = 0
+        self.backtracks = 0
+        self.max_depth = 0
+        self.propagations = 0
+        self.select_time = 0.0
+        self.check_time = 0.0
+        self.undo_time = 0.0
+        self.total_time = 0.0
+        self._depth = 0
+
+    def enter(self):
+        '''Records that the search expanded a node one level deeper.'''
+        self.nodes += 1
+        self._depth += 1
+        if self._depth > self.max_depth:
+            self.max_depth = self._depth
+
+    def leave(self, success):
+        '''Records that the search returned from a node, counting failures as backtracks.'''
+        self._depth -= 1
+        if not success:
+            self.backtracks += 1
+
+    def as_dict(self):
+        '''Returns the stats as a dictionary.'''
+        return {field: getattr(self, field) for field in self.fields}
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.as_dict()})'
+
+
+class _InstrumentedBitmaskSolver(BitmaskSolver):
+    '''Bitmask engine that records SolveStats.'''
+
+    def __init__(self, grid, stats):
+        super().__init__(grid)
+        self.stats = stats
+
+    def _search(self):
+        self.stats.enter()
+        success = super()._search()
+        self.stats.leave(success)
+        return success
+
+    def _select(self):
+        start = time.perf_counter()
+        try:
+            return super()._select()
+        finally:
+            self.stats.select_time += time.perf_counter() - start
+
+    def _propagate(self, trail):
+        start = time.perf_counter()
+        try:
+            return super()._propagate(trail)
+        finally:
+            self.stats.propagations += len(trail)
+            self.stats.check_time += time.perf_counter() - start
+
+    def _remove(self, index):
+        start = time.perf_counter()
+        super()._remove(index)
+        self.stats.undo_time += time.perf_counter() - start
+
+
+class _InstrumentedDancingLinks(DancingLinks):
+    '''Dancing Links engine that records SolveStats.'''
+
+    def __init__(self, grid, stats):
+        # The givens are covered while the links are built
+        self.stats = stats
+        super().__init__(grid)
+
+    def _search(self, chosen):
+        self.stats.enter()
+        success = False
+        try:
+            for solution in super()._search(chosen):
+                success = True
+                yield solution
+        finally:
+            self.stats.leave(success)
+
+    def _choose_column(self):
+        start = time.perf_counter()
+        try:
+            return super()._choose_column()
+        finally:
+            self.stats.select_time += time.perf_counter() - start
+
+    def _cover(self, header):
+        start = time.perf_counter()
+        super()._cover(header)
+        self.stats.check_time += time.perf_counter() - start
+
+    def _uncover(self, header):
+        start = time.perf_counter()
+        super()._uncover(header)
+        self.stats.undo_time += time.perf_counter() - start
+
+
+class _InstrumentedSudoku(Sudoku):
+    '''Reference backtracking engine that records SolveStats.'''
+
+    __slots__ = ('stats',)
+
+    def _backtrack(self):
+        self.stats.enter()
+        success = super()._backtrack()
+        self.stats.leave(success)
+        return success
+
+    def get_empty_cell(self):
+        start = time.perf_counter()
+        try:
+            return super().get_empty_cell()
+        finally:
+            self.stats.select_time += time.perf_counter() - start
+
+    def check_move(self, cell, num):
+        start = time.perf_counter()
+        try:
+            return super().check_move(cell, num)
+        finally:
+            self.stats.check_time += time.perf_counter() - start
+
+    def set_value(self, index, value):
+        if value:
+            super().set_value(index, value)
+            return
+        start = time.perf_counter()
+        super().set_value(index, value)
+        self.stats.undo_time += time.perf_counter() - start
+
+
+def instrumented_solve(game, engine='bitmask', callback=None):
+    '''
+    Solves a Sudoku game like Sudoku.solve while collecting SolveStats.
+    The stats are returned and also passed to callback if one is given.
+    Plain Sudoku.solve is untouched, so there is no cost unless this is used.
+    '''
+    stats = SolveStats(engine)
+    start = time.perf_counter()
+
+    if engine == 'bitmask':
+        solver = _InstrumentedBitmaskSolver(game.values, stats)
+        solution = solver.grid if solver.solve() else None
+    elif engine == 'dlx':
+        solution = next(_InstrumentedDancingLinks(game.values, stats).solutions(), None)
+    elif engine == 'backtrack':
+        # Run on a copy so the instrumented methods apply
+        copy = _InstrumentedSudoku._from_buffers(game.values, game.givens)
+        copy.stats = stats
+        solution = copy.values if copy._backtrack() else None
+    else:
+        raise ValueError(f'Unknown solver engine: {engine}')
+
+    stats.total_time = time.perf_counter() - start
+    stats.solved = solution is not None
+    if solution is not None:
+        game._assign(solution)
+    if callback is not None:
+        callback(stats)
+    return stats
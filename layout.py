@@ -0,0 +1,207 @@
+from array import array
+from functools import lru_cache
+from solver import topology
+
+
+# Set size of game and other constants
+cell_size = 50
+minor_grid_size = 1
+major_grid_size = 3
+buffer = 5
+button_height = 50
+button_width = 125
+button_border = 2
+status_height = 30
+board_size = cell_size*9 + minor_grid_size*6 + major_grid_size*4
+width = board_size + buffer*2
+height = board_size + button_height + buffer*4 + button_border*2 + status_height
+size = width, height
+
+# Left edge of each button below the board and the top edge they share
+button_top = height - status_height - buffer*2 - button_height - button_border*2
+button_lefts = {
+    'hint': buffer,
+    'solve': width - buffer*2 - button_border*4 - button_width*2,
+    'reset': width - buffer - button_border*2 - button_width,
+}
+
+# Status strip along the bottom of the window
+status_area = (buffer, height - status_height - buffer, width - buffer*2, status_height)
+
+# Tournament boards are drawn as tiles with a caption strip above each
+# board, a gap between tiles and cells of at least smallest_cell pixels
+tile_gap = 6
+caption_height = 16
+smallest_cell = 6
+
+
+class RectCell(tuple):
+    '''
+    The (left, top, width, height) rectangle of a cell in the game window,
+    which pygame accepts anywhere it takes a rect, along with the row and
+    column of the cell. It does not need pygame so the board layout can be
+    used without it.
+    '''
+
+    def __new__(cls, left, top, row, col, size=cell_size):
+        cell = super().__new__(cls, (left, top, size, size))
+        cell.row = row
+        cell.col = col
+        return cell
+
+    @property
+    def left(self):
+        return self[0]
+
+    @property
+    def top(self):
+        return self[1]
+
+    @property
+    def width(self):
+        return self[2]
+
+    @property
+    def height(self):
+        return self[3]
+
+    @property
+    def center(self):
+        return self[0] + self[2] // 2, self[1] + self[3] // 2
+
+    def collidepoint(self, pos):
+        '''Returns whether a point lies inside the cell, like pygame.Rect.collidepoint.'''
+        x, y = pos
+        return self[0] <= x < self[0] + self[2] and self[1] <= y < self[1] + self[3]
+
+
+def cell_size_for(box, extent=board_size):
+    '''
+    Returns the largest cell size that fits a board with the given box size
+    in a square of extent pixels, the board area by default.
+    '''
+    size = box * box
+    return (extent - minor_grid_size*(size - box) - major_grid_size*(box + 1)) // size
+
+
+def board_extent(box, size):
+    '''Returns the width and height of a board with the given box and cell size, grid lines included.'''
+    side = box * box
+    return size*side + minor_grid_size*(side - box) + major_grid_size*(box + 1)
+
+
+def cell_offset(position, box, size, origin=buffer):
+    '''
+    Returns the left or top edge of the cells in a column or row of a board
+    whose outer grid line starts at origin.
+    '''
+    return origin + major_grid_size*(position//box + 1) + \
+        minor_grid_size*(position - position//box) + size*position
+
+
+class BoardGeometry:
+    '''
+    Where the cells and grid lines of a board made of box x box boxes are
+    drawn, along with the Topology of the board. The cells are shared
+    RectCells, kept as a flat tuple by cell index and as a tuple of rows,
+    and a click is mapped to its cell with one table lookup per axis. Use
+    geometry to get the shared instance.
+    '''
+
+    def __init__(self, box, size, origin=buffer):
+        '''
+        Builds the tables for a board with the given box and cell size whose
+        top left corner is at (origin, origin).
+        '''
+        self.topology = topology(box)
+        side = self.topology.size
+        self.box = box
+        self.cell_size = size
+        self.origin = origin
+
+        # Left or top edge of the cells in every column or row
+        self.offsets = tuple(cell_offset(position, box, size, origin) for position in range(side))
+        self.cells = tuple(
+            tuple(RectCell(self.offsets[col], self.offsets[row], row, col, size) for col in range(side))
+            for row in range(side)
+        )
+        self.rects = tuple(cell for row in self.cells for cell in row)
+
+        # Grid lines run from the edge of the board to end, the minor lines
+        # are given by their left or top edge and the major lines by their middle
+        self.end = self.offsets[-1] + size + major_grid_size - 1
+        self.minor_lines = tuple(
+            self.offsets[position] - minor_grid_size for position in range(1, side) if position % box
+        )
+        step = size*box + minor_grid_size*(box - 1) + major_grid_size
+        self.major_lines = tuple(range(origin + major_grid_size//2, self.end, step))
+
+        # Column or row of every pixel from the edge of the board, -1 on grid lines
+        self.position_at = array('b', [-1]) * (self.end + 1 - origin)
+        for position, offset in enumerate(self.offsets):
+            self.position_at[offset - origin:offset - origin + size] = array('b', [position]) * size
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.box}, {self.cell_size}, {self.origin})'
+
+    def cell_at(self, pos):
+        '''Returns the RectCell under a point, or None if there is none.'''
+        x, y = pos[0] - self.origin, pos[1] - self.origin
+        if 0 <= x < len(self.position_at) and 0 <= y < len(self.position_at):
+            col = self.position_at[x]
+            row = self.position_at[y]
+            if col >= 0 and row >= 0:
+                return self.cells[row][col]
+        return None
+
+
+def geometry(box=3, size=None, origin=buffer):
+    '''
+    Returns the shared BoardGeometry of a board with the given box size,
+    drawn with cells of size pixels, or filling the board area of the game
+    window by default.
+    '''
+    return _geometry(box, size or cell_size_for(box), origin)
+
+
+@lru_cache(maxsize=None)
+def _geometry(box, size, origin):
+    '''Builds the BoardGeometry returned by geometry once for every set of arguments.'''
+    return BoardGeometry(box, size, origin)
+
+
+def create_cells(box=3):
+    '''Returns all the cells of a board, 81 for the standard board, as rows of RectCells.'''
+    return geometry(box).cells
+
+
+def layout_tiles(count, box, area_width, area_height):
+    '''
+    Lays out count boards with the given box size as tiles filling an area,
+    choosing the number of columns that gives the largest cells. Returns the
+    BoardGeometry shared by the tiles, relative to the top left corner of a
+    tile's board, and the (left, top) corner of every tile. Raises
+    ValueError if the cells would be smaller than smallest_cell pixels.
+    '''
+    best_size, columns = 0, 1
+    for option in range(1, count + 1):
+        rows = -(-count // option)
+        extent = min(
+            (area_width - tile_gap) // option - tile_gap,
+            (area_height - tile_gap) // rows - tile_gap - caption_height,
+        )
+        size = cell_size_for(box, extent)
+        if size > best_size:
+            best_size, columns = size, option
+    if best_size < smallest_cell:
+        raise ValueError(f'{count} boards do not fit in {area_width}x{area_height} pixels.')
+
+    # Center the tiles in the area
+    rows = -(-count // columns)
+    extent = board_extent(box, best_size)
+    step_x = extent + tile_gap
+    step_y = extent + caption_height + tile_gap
+    left = (area_width - columns*step_x + tile_gap) // 2
+    top = (area_height - rows*step_y + tile_gap) // 2
+    tiles = [(left + tile % columns * step_x, top + tile // columns * step_y) for tile in range(count)]
+    return geometry(box, best_size, 0), tiles
@@ -0,0 +1,574 @@
+import argparse
+from collections import deque, namedtuple
+from itertools import combinations
+import os
+import sys
+from solver import (
+    ALL_DIGITS, BIT_COUNTS, BOX_OF, CELL_UNITS, COL_OF, DIGITS_OF, PEERS, ROW_OF, UNITS,
+    BitmaskSolver, Sudoku,
+)
+
+
+# Difficulty grades from easiest to hardest
+DIFFICULTIES = ('easy', 'medium', 'hard', 'expert')
+
+Deduction = namedtuple('Deduction', ['technique', 'placements', 'eliminations', 'cells'])
+Deduction.__doc__ = '''
+A single logical step.
+placements and eliminations are tuples of (index, digit) pairs and cells
+holds the indices of the cells the step was deduced from.
+'''
+
+# Peers of every cell as sets, to find the cells that see two others
+PEER_SETS = [frozenset(peers) for peers in PEERS]
+
+
+class CandidateGrid:
+    '''
+    Tracks the values and remaining candidates of every cell of a puzzle.
+    Every unit has a stamp that changes whenever a value or candidate in it
+    does, so techniques can skip the units they already found nothing in.
+    '''
+
+    def __init__(self, grid):
+        '''
+        Initializes the candidates from a flat list of 81 values where empty
+        cells are 0 or None.
+        '''
+        self.values = [value or 0 for value in grid]
+        self.candidates = [0] * 81
+        self.eliminated = [0] * 81
+        self.eliminations = 0
+        self.stamps = [1] * len(UNITS)
+        self.checked = {}
+        for index in range(81):
+            self._update(index)
+
+    def _touch(self, index):
+        '''Changes the stamps of the units of a cell.'''
+        stamps = self.stamps
+        for unit in CELL_UNITS[index]:
+            stamps[unit] += 1
+
+    def stale_units(self, technique):
+        '''
+        Returns the stamps a technique last found each unit empty at, where
+        a stamp that differs from the current one needs a new look.
+        '''
+        if technique not in self.checked:
+            self.checked[technique] = [0] * len(UNITS)
+        return self.checked[technique]
+
+    def _update(self, index):
+        '''Recomputes the candidates of a cell from its peers and its eliminations.'''
+        self._touch(index)
+        if self.values[index]:
+            self.candidates[index] = 0
+            return
+        used = self.eliminated[index]
+        for peer in PEERS[index]:
+            if self.values[peer]:
+                used |= 1 << (self.values[peer] - 1)
+        self.candidates[index] = ALL_DIGITS & ~used
+
+    def place(self, index, digit):
+        '''Places a digit in a cell and removes it from the cell's peers.'''
+        bit = 1 << (digit - 1)
+        candidates = self.candidates
+        self.values[index] = digit
+        candidates[index] = 0
+        self._touch(index)
+        for peer in PEERS[index]:
+            if candidates[peer] & bit:
+                candidates[peer] &= ~bit
+                self._touch(peer)
+
+    def eliminate(self, index, digit):
+        '''Removes a digit from the candidates of a cell.'''
+        bit = 1 << (digit - 1)
+        if self.candidates[index] & bit:
+            self.candidates[index] &= ~bit
+            self._touch(index)
+        if not self.eliminated[index] & bit:
+            self.eliminated[index] |= bit
+            self.eliminations += 1
+
+    def set_value(self, index, digit):
+        '''
+        Sets a cell to a digit, or clears it with 0, updating only the
+        candidates of the cell and its peers. Taking a value back can make
+        earlier eliminations wrong, so they are dropped when that happens.
+        '''
+        old = self.values[index]
+        if old == digit:
+            return
+        if not old:
+            self.place(index, digit)
+            return
+
+        self.values[index] = digit
+        if self.eliminations:
+            self.eliminated = [0] * 81
+            self.eliminations = 0
+            cells = range(81)
+        else:
+            cells = PEERS[index] + (index,)
+        for cell in cells:
+            self._update(cell)
+
+    def apply(self, deduction):
+        '''Applies the placements and eliminations of a deduction.'''
+        for index, digit in deduction.placements:
+            self.place(index, digit)
+        for index, digit in deduction.eliminations:
+            self.eliminate(index, digit)
+
+    def is_solved(self):
+        '''Returns whether every cell has a value.'''
+        return 0 not in self.values
+
+    def is_broken(self):
+        '''Returns whether an empty cell has no candidates left.'''
+        return any(not value and not candidates
+                   for value, candidates in zip(self.values, self.candidates))
+
+
+def find_naked_single(grid):
+    '''Finds an empty cell with only one candidate left, looking through the changed boxes.'''
+    checked = grid.stale_units('naked single')
+    for unit in range(18, 27):
+        if checked[unit] == grid.stamps[unit]:
+            continue
+        for index in UNITS[unit]:
+            candidates = grid.candidates[index]
+            if BIT_COUNTS[candidates] == 1:
+                return Deduction(
+                    'naked single', ((index, candidates.bit_length()),), (), (index,)
+                )
+        checked[unit] = grid.stamps[unit]
+    return None
+
+
+def find_hidden_single(grid):
+    '''Finds a digit that has only one place left in a row, column or box.'''
+    checked = grid.stale_units('hidden single')
+    for unit_index, unit in enumerate(UNITS):
+        if checked[unit_index] == grid.stamps[unit_index]:
+            continue
+        once = twice = 0
+        for index in unit:
+            twice |= once & grid.candidates[index]
+            once |= grid.candidates[index]
+        singles = once & ~twice
+        if singles:
+            bit = singles & -singles
+            for index in unit:
+                if grid.candidates[index] & bit:
+                    return Deduction(
+                        'hidden single', ((index, bit.bit_length()),), (), tuple(unit)
+                    )
+        checked[unit_index] = grid.stamps[unit_index]
+    return None
+
+
+def find_locked_candidates(grid):
+    '''
+    Finds a digit confined to one line within a box (pointing) or to one box
+    within a line (claiming), which removes it from the rest of the other unit.
+    '''
+    checked = grid.stale_units('locked candidates')
+    for unit_index, unit in enumerate(UNITS):
+        if checked[unit_index] == grid.stamps[unit_index]:
+            continue
+        for digit in range(1, 10):
+            bit = 1 << (digit - 1)
+            cells = [index for index in unit if grid.candidates[index] & bit]
+            if len(cells) < 2:
+                continue
+
+            # Pointing: the digit lies on one row or column of a box
+            if unit_index >= 18:
+                others = []
+                if len({ROW_OF[index] for index in cells}) == 1:
+                    others = UNITS[ROW_OF[cells[0]]]
+                elif len({COL_OF[index] for index in cells}) == 1:
+                    others = UNITS[9 + COL_OF[cells[0]]]
+                technique = 'pointing'
+
+            # Claiming: the digit lies in one box of a row or column
+            elif len({BOX_OF[index] for index in cells}) == 1:
+                others = UNITS[18 + BOX_OF[cells[0]]]
+                technique = 'claiming'
+            else:
+                continue
+
+            eliminations = tuple(
+                (index, digit) for index in others
+                if index not in cells and grid.candidates[index] & bit
+            )
+            if eliminations:
+                return Deduction(technique, (), eliminations, tuple(cells))
+        checked[unit_index] = grid.stamps[unit_index]
+    return None
+
+
+def _find_naked_subset(grid, size, technique):
+    '''Finds size cells of a unit whose candidates together hold size digits.'''
+    checked = grid.stale_units(technique)
+    for unit_index, unit in enumerate(UNITS):
+        if checked[unit_index] == grid.stamps[unit_index]:
+            continue
+        empty = [index for index in unit if 2 <= BIT_COUNTS[grid.candidates[index]] <= size]
+        for cells in combinations(empty, size):
+            union = 0
+            for index in cells:
+                union |= grid.candidates[index]
+            if BIT_COUNTS[union] != size:
+                continue
+            eliminations = tuple(
+                (index, digit) for index in unit if index not in cells
+                for digit in DIGITS_OF[grid.candidates[index] & union]
+            )
+            if eliminations:
+                return Deduction(technique, (), eliminations, cells)
+        checked[unit_index] = grid.stamps[unit_index]
+    return None
+
+
+def _find_hidden_subset(grid, size, technique):
+    '''Finds size digits of a unit that can only go in the same size cells.'''
+    checked = grid.stale_units(technique)
+    for unit_index, unit in enumerate(UNITS):
+        if checked[unit_index] == grid.stamps[unit_index]:
+            continue
+        places = {}
+        for digit in range(1, 10):
+            cells = tuple(index for index in unit if grid.candidates[index] >> (digit - 1) & 1)
+            if 2 <= len(cells) <= size:
+                places[digit] = cells
+        for digits in combinations(places, size):
+            cells = sorted(set().union(*(places[digit] for digit in digits)))
+            if len(cells) != size:
+                continue
+            keep = sum(1 << (digit - 1) for digit in digits)
+            eliminations = tuple(
+                (index, digit) for index in cells
+                for digit in DIGITS_OF[grid.candidates[index] & ~keep]
+            )
+            if eliminations:
+                return Deduction(technique, (), eliminations, tuple(cells))
+        checked[unit_index] = grid.stamps[unit_index]
+    return None
+
+
+def _find_fish(grid, size, technique):
+    '''
+    Finds a digit whose places in size rows fall in the same size columns,
+    or the other way around, which removes it from the rest of those lines.
+    '''
+    for digit in range(1, 10):
+        bit = 1 << (digit - 1)
+        for lines, crossing in ((UNITS[:9], UNITS[9:18]), (UNITS[9:18], UNITS[:9])):
+            # Positions of the digit along every line that has 2 to size of them
+            places = {}
+            for number, line in enumerate(lines):
+                positions = tuple(
+                    position for position, index in enumerate(line) if grid.candidates[index] & bit
+                )
+                if 2 <= len(positions) <= size:
+                    places[number] = positions
+
+            for chosen in combinations(places, size):
+                covered = sorted(set().union(*(places[number] for number in chosen)))
+                if len(covered) != size:
+                    continue
+                eliminations = tuple(
+                    (index, digit) for position in covered
+                    for number, index in enumerate(crossing[position])
+                    if number not in chosen and grid.candidates[index] & bit
+                )
+                if eliminations:
+                    cells = tuple(lines[number][position] for number in chosen for position in places[number])
+                    return Deduction(technique, (), eliminations, cells)
+    return None
+
+
+def find_naked_pair(grid):
+    '''Finds two cells of a unit that share the same two candidates.'''
+    return _find_naked_subset(grid, 2, 'naked pair')
+
+
+def find_hidden_pair(grid):
+    '''Finds two digits of a unit that can only go in the same two cells.'''
+    return _find_hidden_subset(grid, 2, 'hidden pair')
+
+
+def find_naked_triple(grid):
+    '''Finds three cells of a unit whose candidates together hold three digits.'''
+    return _find_naked_subset(grid, 3, 'naked triple')
+
+
+def find_hidden_triple(grid):
+    '''Finds three digits of a unit that can only go in the same three cells.'''
+    return _find_hidden_subset(grid, 3, 'hidden triple')
+
+
+def find_naked_quad(grid):
+    '''Finds four cells of a unit whose candidates together hold four digits.'''
+    return _find_naked_subset(grid, 4, 'naked quad')
+
+
+def find_hidden_quad(grid):
+    '''Finds four digits of a unit that can only go in the same four cells.'''
+    return _find_hidden_subset(grid, 4, 'hidden quad')
+
+
+def find_x_wing(grid):
+    '''Finds a digit confined to the same two columns in two rows, or the same two rows in two columns.'''
+    return _find_fish(grid, 2, 'x-wing')
+
+
+def find_swordfish(grid):
+    '''Finds a digit confined to the same three columns in three rows, or the other way around.'''
+    return _find_fish(grid, 3, 'swordfish')
+
+
+def _chain_cells(parents, state):
+    '''Returns the cells of a chain from its start to state, following the parent states.'''
+    cells = []
+    while state is not None:
+        cells.append(state[0])
+        state = parents[state]
+    cells.reverse()
+    return tuple(cells)
+
+
+def find_x_chain(grid):
+    '''
+    Finds a chain of one digit alternating between strong links, the only
+    two places of the digit in a unit, and weak links, two places that see
+    each other. If the first cell of a chain starting and ending with a
+    strong link does not hold the digit the last one does, so the digit is
+    removed from the cells that see both ends.
+    '''
+    candidates = grid.candidates
+    for digit in range(1, 10):
+        bit = 1 << (digit - 1)
+        places = {index for index in range(81) if candidates[index] & bit}
+        strong = {}
+        for unit in UNITS:
+            cells = [index for index in unit if candidates[index] & bit]
+            if len(cells) == 2:
+                strong.setdefault(cells[0], set()).add(cells[1])
+                strong.setdefault(cells[1], set()).add(cells[0])
+        if len(strong) < 4:
+            continue
+        weak = {index: PEER_SETS[index] & places for index in places}
+
+        # States are (cell, holds digit), the start is assumed not to hold it
+        for start in sorted(strong):
+            parents = {(start, False): None}
+            queue = deque(parents)
+            while queue:
+                state = queue.popleft()
+                index, on = state
+                if on and index != start:
+                    eliminations = tuple(
+                        (cell, digit) for cell in sorted(weak[start] & weak[index])
+                    )
+                    if eliminations:
+                        return Deduction('x-chain', (), eliminations, _chain_cells(parents, state))
+                for link in (weak[index] if on else strong.get(index, ())):
+                    following = (link, not on)
+                    if following not in parents:
+                        parents[following] = state
+                        queue.append(following)
+    return None
+
+
+def find_xy_chain(grid):
+    '''
+    Finds a chain of cells with two candidates each, where every cell sees
+    the next and shares a digit with it. If the first cell does not hold a
+    digit, every cell of the chain holds its other digit, so when the last
+    cell would then hold the same digit one of the two ends does, and the
+    digit is removed from the cells that see both ends.
+    '''
+    candidates = grid.candidates
+    pairs = {index for index in range(81) if BIT_COUNTS[candidates[index]] == 2}
+    links = {index: PEER_SETS[index] & pairs for index in pairs}
+    for start in sorted(pairs):
+        for digit in DIGITS_OF[candidates[start]]:
+            # States are (cell, digit it holds) assuming the start does not hold digit
+            other = DIGITS_OF[candidates[start] & ~(1 << (digit - 1))][0]
+            first = (start, other)
+            parents = {first: None}
+            queue = deque(parents)
+            while queue:
+                state = queue.popleft()
+                index, held = state
+                if held == digit and index != start:
+                    bit = 1 << (digit - 1)
+                    eliminations = tuple(
+                        (cell, digit) for cell in sorted(PEER_SETS[start] & PEER_SETS[index])
+                        if candidates[cell] & bit
+                    )
+                    if eliminations:
+                        return Deduction('xy-chain', (), eliminations, _chain_cells(parents, state))
+                bit = 1 << (held - 1)
+                for link in links[index]:
+                    if candidates[link] & bit:
+                        following = (link, DIGITS_OF[candidates[link] & ~bit][0])
+                        if following not in parents:
+                            parents[following] = state
+                            queue.append(following)
+    return None
+
+
+# Techniques in the order they are tried, with the difficulty each one implies
+TECHNIQUES = [
+    (find_hidden_single, 'easy'),
+    (find_naked_single, 'medium'),
+    (find_locked_candidates, 'hard'),
+    (find_naked_pair, 'hard'),
+    (find_hidden_pair, 'hard'),
+    (find_naked_triple, 'hard'),
+    (find_hidden_triple, 'hard'),
+    (find_x_wing, 'expert'),
+    (find_swordfish, 'expert'),
+    (find_naked_quad, 'expert'),
+    (find_hidden_quad, 'expert'),
+    (find_x_chain, 'expert'),
+    (find_xy_chain, 'expert'),
+]
+
+
+def cell_name(index):
+    '''Returns the row and column name of a cell index, such as r1c1 for index 0.'''
+    return f'r{ROW_OF[index] + 1}c{COL_OF[index] + 1}'
+
+
+def describe(deduction):
+    '''Returns a short description of a deduction.'''
+    if deduction.placements:
+        changes = ', '.join(f'{cell_name(index)}={digit}' for index, digit in deduction.placements)
+    else:
+        changes = ', '.join(f'{cell_name(index)}<>{digit}' for index, digit in deduction.eliminations)
+    return f'{deduction.technique}: {changes}'
+
+
+def next_deduction(grid, techniques=TECHNIQUES):
+    '''Returns the first deduction found by the easiest technique, or None.'''
+    for find, _ in techniques:
+        deduction = find(grid)
+        if deduction is not None:
+            return deduction
+    return None
+
+
+def solve_logically(grid, techniques=TECHNIQUES):
+    '''
+    Applies the easiest available technique until the puzzle is solved or no
+    technique applies. Returns the CandidateGrid and a list of
+    (deduction, difficulty) steps.
+    '''
+    candidates = CandidateGrid(grid)
+    return candidates, _continue_logically(candidates, techniques)
+
+
+def explain(grid, techniques=TECHNIQUES):
+    '''
+    Solves a puzzle like solve_logically, but when no technique applies the
+    most constrained cell is filled in from a solution found by search and
+    the techniques carry on from there. Those steps have the technique
+    'search' and the difficulty 'expert'. Returns the CandidateGrid and the
+    list of (deduction, difficulty) steps, which stop early only if the
+    puzzle has no solution.
+    '''
+    candidates, steps = solve_logically(grid, techniques)
+    solution = None
+    while not candidates.is_solved() and not candidates.is_broken():
+        if solution is None:
+            solver = BitmaskSolver(grid)
+            if not solver.solve():
+                break
+            solution = solver.grid
+        index = min(
+            (index for index in range(81) if not candidates.values[index]),
+            key=lambda index: BIT_COUNTS[candidates.candidates[index]]
+        )
+        guess = Deduction('search', ((index, solution[index]),), (), (index,))
+        candidates.apply(guess)
+        steps.append((guess, DIFFICULTIES[-1]))
+
+        steps.extend(_continue_logically(candidates, techniques))
+    return candidates, steps
+
+
+def _continue_logically(candidates, techniques):
+    '''Applies techniques to a CandidateGrid until none applies. Returns the list of steps.'''
+    steps = []
+    while not candidates.is_solved() and not candidates.is_broken():
+        deduction = None
+        for find, difficulty in techniques:
+            deduction = find(candidates)
+            if deduction is not None:
+                candidates.apply(deduction)
+                steps.append((deduction, difficulty))
+                break
+        if deduction is None:
+            break
+    return steps
+
+
+def format_trace(steps):
+    '''Returns the steps of solve_logically or explain as one described step per line.'''
+    return '\n'.join(f'{number}. {describe(deduction)}' for number, (deduction, _) in enumerate(steps, 1))
+
+
+def grade(grid):
+    '''
+    Returns the difficulty of a puzzle, the hardest technique needed to solve
+    it. Puzzles the techniques cannot finish are graded 'expert'.
+    '''
+    candidates, steps = solve_logically(grid)
+    if not candidates.is_solved():
+        return DIFFICULTIES[-1]
+    level = max((DIFFICULTIES.index(difficulty) for _, difficulty in steps), default=0)
+    return DIFFICULTIES[level]
+
+
+def main(argv=None):
+    '''Command line entry point for grading and explaining puzzles.'''
+    parser = argparse.ArgumentParser(
+        description='Grade 9x9 puzzles by the techniques they need and explain their solutions.'
+    )
+    parser.add_argument('puzzles', help='a puzzle string or a file with one puzzle per line')
+    parser.add_argument('--trace', action='store_true',
+                        help='print the steps that solve each puzzle')
+    args = parser.parse_args(argv)
+
+    if os.path.isfile(args.puzzles):
+        with open(args.puzzles) as file:
+            puzzles = [line.strip() for line in file if line.strip() and not line.startswith('#')]
+    else:
+        puzzles = [args.puzzles]
+
+    for puzzle in puzzles:
+        game = Sudoku.from_string(puzzle)
+        if len(game.values) != 81:
+            print(f'{puzzle} skipped, only 9x9 puzzles can be graded', file=sys.stderr)
+            continue
+        candidates, steps = explain(game.values)
+        if not candidates.is_solved():
+            print(f'{puzzle} unsolvable')
+            continue
+        level = max((DIFFICULTIES.index(difficulty) for _, difficulty in steps), default=0)
+        searches = sum(deduction.technique == 'search' for deduction, _ in steps)
+        print(f'{puzzle} {DIFFICULTIES[level]} {len(steps)} steps {searches} searched')
+        if args.trace:
+            print(format_trace(steps))
+
+
+if __name__ == '__main__':
+    main()
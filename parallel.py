@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import time
+from solver import (
+    EXHAUSTED, SOLVED, UNSOLVABLE, BitmaskSolver, Budget, BudgetExhausted, CancelToken,
+    Sudoku, _BudgetedDancingLinks,
+)
+
+
+# Branches wanted per worker when the split depth is chosen automatically,
+# so a worker that finishes a small subtree early has more to take
+BRANCHES_PER_WORKER = 4
+MAX_DEPTH = 4
+
+# Cancel token shared by the worker processes of a pool
+_cancel = None
+
+
+def _init_worker(event):
+    '''Sets the cancel token of a worker process from the event of its pool.'''
+    global _cancel
+    _cancel = CancelToken(event)
+
+
+def _budget(deadline):
+    '''Returns the budget of a branch solved before a time.monotonic deadline.'''
+    return Budget(None if deadline is None else deadline - time.monotonic(), None, _cancel)
+
+
+def _solve_branch(task):
+    '''
+    Searches one branch given as a (grid, engine, deadline) tuple. Returns the
+    solution as a flat list, None if the branch has none or EXHAUSTED if it
+    was cancelled or ran out of time.
+    '''
+    grid, engine, deadline = task
+    values = bytes(grid)
+    try:
+        return Sudoku._from_buffers(values, values)._find_solution(engine, _budget(deadline))
+    except BudgetExhausted:
+        return EXHAUSTED
+
+
+def _count_branch(task):
+    '''
+    Counts the solutions of one branch given as a (grid, limit, deadline)
+    tuple. Returns None if it was cancelled or ran out of time.
+    '''
+    grid, limit, deadline = task
+    try:
+        return _BudgetedDancingLinks(grid, _budget(deadline)).count_solutions(limit)
+    except BudgetExhausted:
+        return None
+
+
+def split(grid, workers, depth=None):
+    '''
+    Returns the branches of the search of a flat grid, split depth levels
+    down from the most constrained cell. Without a depth the split goes
+    deeper until there are BRANCHES_PER_WORKER branches for every worker.
+    '''
+    solver = BitmaskSolver(grid)
+    if depth is not None:
+        return solver.split(depth)
+    for depth in range(1, MAX_DEPTH + 1):
+        branches = solver.split(depth)
+        if len(branches) >= workers * BRANCHES_PER_WORKER:
+            break
+    return branches
+
+
+def parallel_solve(game, workers=None, depth=None, engine='bitmask', timeout=None):
+    '''
+    Solves a game like Sudoku.solve_within by searching the branches of the
+    search tree in worker processes. The other workers are cancelled as soon
+    as one finds a solution. Returns SOLVED, UNSOLVABLE or EXHAUSTED if the
+    solve took longer than timeout seconds. The board is only changed if solved.
+    '''
+    workers = workers or os.cpu_count() or 1
+    deadline = None if timeout is None else time.monotonic() + timeout
+    outcome = UNSOLVABLE
+    cancel = multiprocessing.Event()
+    tasks = ((grid, engine, deadline) for grid in split(game.values, workers, depth))
+    with multiprocessing.Pool(workers, _init_worker, (cancel,)) as pool:
+        for solution in pool.imap_unordered(_solve_branch, tasks):
+            if solution == EXHAUSTED:
+                outcome = EXHAUSTED
+            elif solution is not None:
+                cancel.set()
+                game._assign(solution)
+                return SOLVED
+    return outcome
+
+
+def parallel_count_solutions(game, limit=None, workers=None, depth=None, timeout=None):
+    '''
+    Counts the solutions of a game like Sudoku.count_solutions by counting
+    every branch of the search tree in worker processes and adding them up.
+    Once limit solutions are found the other workers are cancelled. Returns
+    None if counting took longer than timeout seconds.
+    '''
+    workers = workers or os.cpu_count() or 1
+    deadline = None if timeout is None else time.monotonic() + timeout
+    total = 0
+    cancel = multiprocessing.Event()
+    tasks = ((grid, limit, deadline) for grid in split(game.values, workers, depth))
+    with multiprocessing.Pool(workers, _init_worker, (cancel,)) as pool:
+        for count in pool.imap_unordered(_count_branch, tasks):
+            if count is None:
+                cancel.set()
+                return None
+            total += count
+            if limit is not None and total >= limit:
+                cancel.set()
+                return limit
+    return total
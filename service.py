@@ -0,0 +1,317 @@
+import argparse
+import asyncio
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import sys
+import time
+from solver import EXHAUSTED, SOLVED, UNSOLVABLE, Sudoku
+
+
+class DeadlineExceeded(Exception):
+    '''Raised when a puzzle is not solved before the deadline of its request.'''
+
+
+def solve_batch(tasks, engine='bitmask'):
+    '''
+    Solves a batch of (puzzle, deadline) pairs in a worker process, where
+    deadline is a time.monotonic time. Each puzzle only gets the time left
+    until its deadline when its turn comes, and puzzles whose deadline has
+    passed are given up on without solving them. Returns a list of
+    (outcome, solution) pairs, where outcome is SOLVED, UNSOLVABLE or
+    EXHAUSTED and solution is the solved puzzle string or None.
+    '''
+    results = []
+    for puzzle, deadline in tasks:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            results.append((EXHAUSTED, None))
+            continue
+        game = Sudoku.from_string(puzzle)
+        outcome = game.solve_within(engine, timeout)
+        results.append((outcome, game.to_string() if outcome == SOLVED else None))
+    return results
+
+
+class _Pending:
+    '''A puzzle waiting to be solved and the future its requests wait on.'''
+
+    __slots__ = ('puzzle', 'future', 'deadline')
+
+    def __init__(self, puzzle, future, deadline):
+        self.puzzle = puzzle
+        self.future = future
+        self.deadline = deadline
+
+
+class SolveService:
+    '''
+    Solves puzzles for many concurrent requests without blocking the event
+    loop. Requests are queued and coalesced into micro-batches of up to
+    batch_size puzzles, waiting at most batch_delay seconds for a batch to
+    fill, which run in a pool of worker processes. Requests for a puzzle
+    that is already queued or being solved share its result. Every request
+    has a deadline, and puzzles whose requests have all timed out are
+    dropped from the queue or given up on by the worker.
+    '''
+
+    def __init__(self, workers=None, batch_size=32, batch_delay=0.002, deadline=5.0,
+                 engine='bitmask', history=10000):
+        '''
+        Initializes a service with the given number of worker processes and
+        default request deadline in seconds. The latency percentiles cover
+        the last history requests.
+        '''
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.deadline = deadline
+        self.engine = engine
+        self.pending = {}
+        self.queue = deque()
+        self.latencies = deque(maxlen=history)
+        self.requests = 0
+        self.deduplicated = 0
+        self.timeouts = 0
+        self.running_batches = 0
+        self.pool = None
+        self._ready = None
+        self._slots = None
+        self._batcher = None
+        self._batches = set()
+
+    async def start(self):
+        '''Starts the worker processes and the batching loop.'''
+        self.workers = self.workers or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(self.workers)
+        self._ready = asyncio.Event()
+        # Two batches per worker keep the workers busy while results come back
+        self._slots = asyncio.Semaphore(self.workers * 2)
+        self._batcher = asyncio.create_task(self._run())
+
+    async def close(self):
+        '''Stops the batching loop and the worker processes.'''
+        self._batcher.cancel()
+        for task in list(self._batches):
+            task.cancel()
+        await asyncio.gather(self._batcher, *self._batches, return_exceptions=True)
+        # Waiting for a running batch would block the event loop
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def solve(self, puzzle, deadline=None):
+        '''
+        Returns the solution of a puzzle string, or None if it cannot be
+        solved. Raises ValueError for an invalid puzzle and DeadlineExceeded
+        if it is not solved within deadline seconds, the service default if
+        not given.
+        '''
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        expires = start + (self.deadline if deadline is None else deadline)
+        puzzle = Sudoku.from_string(puzzle).to_string()
+        self.requests += 1
+
+        pending = self.pending.get(puzzle)
+        if pending is None:
+            pending = _Pending(puzzle, loop.create_future(), expires)
+            self.pending[puzzle] = pending
+            self.queue.append(pending)
+            self._ready.set()
+        else:
+            # A worker already solving the puzzle keeps its budget, so a
+            # later deadline gets the puzzle solved again if it runs out
+            self.deduplicated += 1
+            pending.deadline = max(pending.deadline, expires)
+
+        try:
+            outcome, solution = await asyncio.wait_for(
+                asyncio.shield(pending.future), max(expires - loop.time(), 0)
+            )
+        except asyncio.TimeoutError:
+            outcome = EXHAUSTED
+        self.latencies.append(loop.time() - start)
+        if outcome == EXHAUSTED:
+            self.timeouts += 1
+            raise DeadlineExceeded(f'Puzzle was not solved within the deadline: {puzzle}')
+        return solution
+
+    async def _run(self):
+        '''Collects queued puzzles into batches and hands them to the workers.'''
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._ready.wait()
+            await self._slots.acquire()
+
+            # Give a small batch a moment to fill up
+            if len(self.queue) < self.batch_size:
+                await asyncio.sleep(self.batch_delay)
+
+            now = loop.time()
+            batch = []
+            while self.queue and len(batch) < self.batch_size:
+                pending = self.queue.popleft()
+                if pending.deadline <= now:
+                    self._finish(pending, (EXHAUSTED, None))
+                else:
+                    batch.append(pending)
+            if not self.queue:
+                self._ready.clear()
+
+            if batch:
+                task = asyncio.create_task(self._solve_batch(batch))
+                self._batches.add(task)
+                task.add_done_callback(self._batches.discard)
+            else:
+                self._slots.release()
+
+    async def _solve_batch(self, batch):
+        '''Solves a batch in the pool and passes the results to its requests.'''
+        loop = asyncio.get_running_loop()
+        self.running_batches += 1
+        try:
+            # Deadlines are passed as time.monotonic times so the worker can
+            # count the time the batch waited and the puzzles before each one
+            offset = time.monotonic() - loop.time()
+            tasks = [(pending.puzzle, pending.deadline + offset) for pending in batch]
+            try:
+                results = await loop.run_in_executor(self.pool, solve_batch, tasks, self.engine)
+            except Exception as error:
+                for pending in batch:
+                    self._fail(pending, error)
+                return
+            now = loop.time()
+            for pending, result in zip(batch, results):
+                # A request that joined after the batch was sent may still
+                # have time left that the worker's budget did not cover
+                if result[0] == EXHAUSTED and pending.deadline > now:
+                    self.queue.append(pending)
+                    self._ready.set()
+                else:
+                    self._finish(pending, result)
+        finally:
+            self.running_batches -= 1
+            self._slots.release()
+
+    def _finish(self, pending, result):
+        '''Passes the (outcome, solution) result of a puzzle to its requests.'''
+        del self.pending[pending.puzzle]
+        if not pending.future.done():
+            pending.future.set_result(result)
+
+    def _fail(self, pending, error):
+        '''Passes an error raised while solving a puzzle to its requests.'''
+        del self.pending[pending.puzzle]
+        if not pending.future.done():
+            pending.future.set_exception(error)
+
+    def percentile(self, fraction):
+        '''Returns the request latency in seconds below which fraction of the recent requests finished.'''
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)]
+
+    def stats(self):
+        '''Returns the queue depth, request counts and latency percentiles as a dictionary.'''
+        return {
+            'queue_depth': len(self.queue),
+            'in_flight': len(self.pending),
+            'running_batches': self.running_batches,
+            'workers': self.workers,
+            'requests': self.requests,
+            'deduplicated': self.deduplicated,
+            'timeouts': self.timeouts,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+        }
+
+
+async def handle_client(service, reader, writer):
+    '''
+    Serves one connection. Every line is a puzzle string answered with its
+    solution, UNSOLVABLE, TIMEOUT or ERROR and a message, or STATS answered
+    with the service stats as JSON. Requests may be pipelined and are
+    answered in order.
+    '''
+    async def answer(line):
+        if line == 'STATS':
+            return json.dumps(service.stats())
+        try:
+            solution = await service.solve(line)
+        except ValueError as error:
+            return f'ERROR {error}'
+        except DeadlineExceeded:
+            return 'TIMEOUT'
+        return UNSOLVABLE.upper() if solution is None else solution
+
+    answers = asyncio.Queue()
+
+    async def write_answers():
+        while True:
+            task = await answers.get()
+            if task is None:
+                break
+            writer.write((await task + '\n').encode())
+            await writer.drain()
+
+    writing = asyncio.create_task(write_answers())
+    try:
+        async for line in reader:
+            line = line.decode().strip()
+            if line:
+                answers.put_nowait(asyncio.create_task(answer(line)))
+        answers.put_nowait(None)
+        await writing
+    finally:
+        writing.cancel()
+        writer.close()
+
+
+async def serve(host='127.0.0.1', port=8765, **options):
+    '''Runs a SolveService with the given options behind a TCP server until cancelled.'''
+    async with SolveService(**options) as service:
+        server = await asyncio.start_server(
+            lambda reader, writer: handle_client(service, reader, writer), host, port
+        )
+        print(f'Solving puzzles on {host}:{port} with {service.workers} workers', file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    '''Command line entry point for running the solving service.'''
+    parser = argparse.ArgumentParser(
+        description='Serve puzzle solving over TCP, one puzzle string per line.'
+    )
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('-p', '--port', type=int, default=8765, help='port to listen on (default: 8765)')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='number of worker processes (default: all cores)')
+    parser.add_argument('-b', '--batch-size', type=int, default=32,
+                        help='most puzzles sent to a worker at a time (default: 32)')
+    parser.add_argument('-d', '--batch-delay', type=float, default=0.002,
+                        help='seconds to wait for a batch to fill (default: 0.002)')
+    parser.add_argument('-t', '--deadline', type=float, default=5.0,
+                        help='seconds a request may take (default: 5)')
+    parser.add_argument('-e', '--engine', default='bitmask', choices=['bitmask', 'dlx', 'backtrack'],
+                        help='solver engine to use (default: bitmask)')
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args.host, args.port, workers=args.workers, batch_size=args.batch_size,
+                          batch_delay=args.batch_delay, deadline=args.deadline, engine=args.engine))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
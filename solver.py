@@ -1,51 +1,179 @@
+from collections import namedtuple
+from functools import lru_cache
 import random
+import threading
+import time
+
+
+# Supported box sizes, giving 4x4, 9x9, 16x16 and 25x25 boards
+BOX_SIZES = (2, 3, 4, 5)
+
+# Length of a puzzle string for every supported board
+PUZZLE_LENGTHS = tuple(box ** 4 for box in BOX_SIZES)
+
+# Characters used for the digits 1 to 25 in puzzle strings
+DIGIT_CHARS = '123456789ABCDEFGHIJKLMNOP'
+
+
+class Topology:
+    '''
+    Lookup tables for a board made of box x box boxes, with size = box * box
+    rows, columns, boxes and digits. Every digit is stored as a bit, digit d
+    uses bit d - 1. Use topology or topology_of to get the shared instance.
+    '''
+
+    def __init__(self, box):
+        '''Builds the tables for a board with the given box size.'''
+        size = box * box
+        cells = size * size
+        self.box = box
+        self.size = size
+        self.cells = cells
+        self.all_digits = (1 << size) - 1
+
+        # Row, column and box of every cell index in a flat grid
+        self.row_of = [index // size for index in range(cells)]
+        self.col_of = [index % size for index in range(cells)]
+        self.box_of = [
+            (index // (size * box)) * box + (index % size) // box for index in range(cells)
+        ]
+
+        # Cell indices making up each of the rows, columns and boxes
+        self.units = (
+            [[row * size + col for col in range(size)] for row in range(size)]
+            + [[row * size + col for row in range(size)] for col in range(size)]
+            + [
+                [(b // box * box + i // box) * size + b % box * box + i % box for i in range(size)]
+                for b in range(size)
+            ]
+        )
+
+        # Indices into units of the row, column and box of each cell index
+        self.cell_units = [
+            (self.row_of[index], size + self.col_of[index], size * 2 + self.box_of[index])
+            for index in range(cells)
+        ]
+
+        # Cells sharing a row, column or box with each cell index
+        self.peers = [
+            tuple(sorted(set().union(*(self.units[unit] for unit in self.cell_units[index])) - {index}))
+            for index in range(cells)
+        ]
+
+        # Bit counts and digits are looked up in tables, except on 25x25
+        # boards where the tables would need 2**25 entries
+        if size <= 16:
+            self.bit_counts = [bin(mask).count('1') for mask in range(self.all_digits + 1)]
+            self.digits_of = [
+                tuple(digit for digit in range(1, size + 1) if mask >> (digit - 1) & 1)
+                for mask in range(self.all_digits + 1)
+            ]
+            self.bit_count = self.bit_counts.__getitem__
+            self.digits = self.digits_of.__getitem__
+        else:
+            self.bit_counts = self.digits_of = None
+            self.bit_count = _bit_count
+            self.digits = _digits
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.box})'
+
+
+def _bit_count(mask):
+    '''Returns the number of set bits of a candidate mask.'''
+    return bin(mask).count('1')
+
+
+def _digits(mask):
+    '''Returns the digits contained in a candidate mask.'''
+    digits = []
+    while mask:
+        bit = mask & -mask
+        digits.append(bit.bit_length())
+        mask ^= bit
+    return tuple(digits)
+
+
+@lru_cache(maxsize=None)
+def topology(box=3):
+    '''Returns the shared Topology of a board with the given box size.'''
+    if box not in BOX_SIZES:
+        raise ValueError(f'Unsupported box size: {box}')
+    return Topology(box)
+
+
+def topology_of(cells):
+    '''Returns the Topology of a board with the given number of cells.'''
+    for box in BOX_SIZES:
+        if box ** 4 == cells:
+            return topology(box)
+    raise ValueError(f'No supported board has {cells} cells.')
+
+
+STANDARD = topology(3)
+
+# Tables of the standard 9x9 board
+ALL_DIGITS = STANDARD.all_digits
+BIT_COUNTS = STANDARD.bit_counts
+DIGITS_OF = STANDARD.digits_of
+ROW_OF = STANDARD.row_of
+COL_OF = STANDARD.col_of
+BOX_OF = STANDARD.box_of
+UNITS = STANDARD.units
+CELL_UNITS = STANDARD.cell_units
+PEERS = STANDARD.peers
+
+# Outcomes of a solve with a budget
+SOLVED = 'solved'
+UNSOLVABLE = 'unsolvable'
+EXHAUSTED = 'exhausted'
+
+Step = namedtuple('Step', ['kind', 'index', 'value'])
+Step.__doc__ = '''
+An event yielded by Sudoku.solve_steps. kind is 'place', 'reject' or
+'backtrack' for a value at a cell index, or 'solved' or 'failed' at the end.
+'''
 
 
 class Cell:
-    '''Represents a cell within a game of Sudoku.'''
+    '''
+    Represents a cell within a game of Sudoku.
+    A cell is a thin view onto its game's flat value buffer.
+    '''
 
-    def __init__(self, row, col, value, editable):
-        '''Initializes an instance of a Sudoku cell.'''
-        self.row = row
-        self.col = col
-        self.value = value
-        self._editable = editable
+    __slots__ = ('_game', '_index')
+
+    def __init__(self, game, index):
+        '''Initializes a view of the cell at index within a Sudoku game.'''
+        if index < 0 or index >= game.topology.cells:
+            raise AttributeError(f'Index must be between 0 and {game.topology.cells - 1}.')
+        self._game = game
+        self._index = index
+
+    @property
+    def index(self):
+        '''Getter method for index.'''
+        return self._index
 
     @property
     def row(self):
         '''Getter method for row.'''
-        return self._row
-
-    @row.setter
-    def row(self, row):
-        '''Setter method for row.'''
-        if row < 0 or row > 8:
-            raise AttributeError('Row must be between 0 and 8.')
-        else:
-            self._row = row
+        return self._game.topology.row_of[self._index]
 
     @property
     def col(self):
         '''Getter method for col.'''
-        return self._col
-
-    @col.setter
-    def col(self, col):
-        '''Setter method for col.'''
-        if col < 0 or col > 8:
-            raise AttributeError('Col must be between 0 and 8.')
-        else:
-            self._col = col
+        return self._game.topology.col_of[self._index]
 
     @property
     def value(self):
         '''Getter method for value.'''
-        return self._value
+        return self._game.values[self._index] or None
 
     @property
     def editable(self):
         '''Getter method for editable.'''
-        return self._editable
+        return not self._game.givens[self._index]
 
     def __repr__(self):
         return f'{self.__class__.__name__}({self.value})'
@@ -53,88 +181,302 @@ class Cell:
     @value.setter
     def value(self, value):
         '''Setter method for value.'''
-        if value is not None and (value < 1 or value > 9):
-            raise AttributeError('Value must be between 1 and 9.')
+        size = self._game.topology.size
+        if value is not None and (value < 1 or value > size):
+            raise AttributeError(f'Value must be between 1 and {size}.')
         else:
-            self._value = value
+            self._game.set_value(self._index, value or 0)
 
 
 class Sudoku:
-    '''Represents a game/board of Sudoku.'''
+    '''
+    Represents a game/board of Sudoku.
+    The values are stored in one flat byte buffer, 81 bytes for the standard
+    9x9 board, with 0 for empty cells. Changes must go through set_value or
+    the cells so that the digit counts of every unit and the set of
+    conflicting cells stay up to date.
+    '''
+
+    __slots__ = (
+        'values', 'givens', 'conflicts', 'topology',
+        '_cells', '_counts', '_filled', '_listeners',
+    )
 
     def __init__(self, board):
-        '''Initializes an instance of a Sudoku game.'''
-        self.board = []
-        for row in range(9):
-            self.board.append([])
-            for col in range(9):
-                if board[row][col] == 0:
-                    val = None
-                    editable = True
-                else:
-                    val = board[row][col]
-                    editable = False
-                self.board[row].append(Cell(row, col, val, editable))
+        '''
+        Initializes an instance of a Sudoku game from a square list of rows,
+        9x9 for the standard game or 4x4, 16x16 or 25x25 for the variants.
+        '''
+        size = len(board)
+        topology_of(size * size)
+        values = bytearray(size * size)
+        for row in range(size):
+            if len(board[row]) != size:
+                raise ValueError('Board must be square.')
+            for col in range(size):
+                value = board[row][col] or 0
+                if value < 0 or value > size:
+                    raise AttributeError(f'Value must be between 1 and {size}.')
+                values[row * size + col] = value
+        self._setup(values, values)
+
+    @classmethod
+    def _from_buffers(cls, values, givens):
+        '''Creates a game directly from its value and given buffers.'''
+        game = cls.__new__(cls)
+        game._setup(values, givens)
+        return game
+
+    def _setup(self, values, givens):
+        '''Sets the buffers of the game and counts the digits in every unit.'''
+        self.topology = topology_of(len(values))
+        self.values = bytearray(values)
+        self.givens = bytes(givens)
+        self._cells = None
+        self._listeners = []
+        self._recount()
+
+    def _recount(self):
+        '''Rebuilds the unit digit counts and the conflict set from scratch.'''
+        topology = self.topology
+        stride = topology.size + 1
+        counts = bytearray(len(topology.units) * stride)
+        for index, value in enumerate(self.values):
+            if value:
+                for unit in topology.cell_units[index]:
+                    counts[unit * stride + value] += 1
+        self._counts = counts
+        self._filled = topology.cells - self.values.count(0)
+        self.conflicts = {index for index in range(topology.cells) if self._conflicting(index)}
+
+    def _conflicting(self, index):
+        '''Returns whether the value at index appears again in one of its units.'''
+        value = self.values[index]
+        if not value:
+            return False
+        counts = self._counts
+        stride = self.topology.size + 1
+        for unit in self.topology.cell_units[index]:
+            if counts[unit * stride + value] > 1:
+                return True
+        return False
+
+    def set_value(self, index, value):
+        '''
+        Sets the value of the cell at index, with 0 for empty, and updates
+        the unit counts and conflicts before notifying subscribers.
+        '''
+        values = self.values
+        old = values[index]
+        if old == value:
+            return
+        values[index] = value
+
+        counts = self._counts
+        topology = self.topology
+        stride = topology.size + 1
+        units = topology.cell_units[index]
+        for unit in units:
+            if old:
+                counts[unit * stride + old] -= 1
+            if value:
+                counts[unit * stride + value] += 1
+        self._filled += (value != 0) - (old != 0)
+
+        # Only cells holding the old or new digit in the same units can change
+        self.conflicts.discard(index)
+        for unit in units:
+            for peer in topology.units[unit]:
+                if values[peer] and (values[peer] == old or values[peer] == value):
+                    if self._conflicting(peer):
+                        self.conflicts.add(peer)
+                    else:
+                        self.conflicts.discard(peer)
+
+        for listener in self._listeners:
+            listener(index, old, value)
+
+    def _assign(self, values):
+        '''Sets every cell whose value differs from a flat list of values.'''
+        current = self.values
+        for index in range(len(current)):
+            if current[index] != values[index]:
+                self.set_value(index, values[index])
+
+    def subscribe(self, listener):
+        '''Calls listener(index, old, new) every time the value of a cell changes.'''
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        '''Stops calling a listener added with subscribe.'''
+        self._listeners.remove(listener)
+
+    def is_conflicting(self, cell):
+        '''Returns whether the value of a cell is repeated in its row, column or box.'''
+        return cell.index in self.conflicts
+
+    @property
+    def filled(self):
+        '''Returns the number of cells that are filled in.'''
+        return self._filled
+
+    def is_complete(self):
+        '''Returns whether every cell is filled in without any conflicts.'''
+        return self._filled == self.topology.cells and not self.conflicts
+
+    @classmethod
+    def from_string(cls, text):
+        '''
+        Creates a game from a puzzle string read row by row, using '.' or '0'
+        for empty cells. An 81 character string gives the standard board and
+        16, 256 or 625 characters give the variants, whose digits above 9 are
+        the letters A to P.
+        '''
+        text = text.strip().upper()
+        if len(text) not in PUZZLE_LENGTHS:
+            raise ValueError('Puzzle must be 81 characters long, or 16, 256 or 625 for the variants.')
+        size = topology_of(len(text)).size
+        values = bytearray(len(text))
+        for index, char in enumerate(text):
+            value = DIGIT_CHARS.find(char, 0, size) + 1
+            if value:
+                values[index] = value
+            elif char not in '.0':
+                raise ValueError(f'Invalid character in puzzle: {char!r}')
+        return cls._from_buffers(values, values)
+
+    def to_string(self):
+        '''Returns the board as a string read row by row with '.' for empty cells.'''
+        return grid_to_string(self.values)
+
+    @property
+    def board(self):
+        '''Getter method for board, a square list of cell views built on first use.'''
+        if self._cells is None:
+            size = self.topology.size
+            self._cells = [
+                [Cell(self, row * size + col) for col in range(size)] for row in range(size)
+            ]
+        return self._cells
+
+    def copy(self):
+        '''Returns an independent copy of the game without its subscribers.'''
+        game = self.__class__.__new__(self.__class__)
+        game.values = bytearray(self.values)
+        game.givens = self.givens
+        game.topology = self.topology
+        game.conflicts = set(self.conflicts)
+        game._cells = None
+        game._counts = bytearray(self._counts)
+        game._filled = self._filled
+        game._listeners = []
+        return game
+
+    def snapshot(self):
+        '''Returns an immutable copy of the current values.'''
+        return bytes(self.values)
+
+    def restore(self, snapshot):
+        '''Restores the values saved by snapshot.'''
+        self._assign(snapshot)
 
     def check_move(self, cell, num):
         '''Returns whether a number is a valid move for a cell.'''
-        # Check if the number is valid for the row
-        for col in range(9):
-            if self.board[cell.row][col].value == num and col != cell.col:
+        values = self.values
+        for peer in self.topology.peers[cell.index]:
+            if values[peer] == num:
                 return False
 
-        # Check if the number is valid for the column
-        for row in range(9):
-            if self.board[row][cell.col].value == num and row != cell.row:
-                return False
-
-        # Check if the number is valid in its box
-        for row in range(cell.row // 3 * 3, cell.row // 3 * 3 + 3):
-            for col in range(cell.col // 3 * 3, cell.col // 3 * 3 + 3):
-                if (
-                    self.board[row][col].value == num
-                    and row != cell.row
-                    and col != cell.col
-                ):
-                    return False
-
         # Move is valid
         return True
 
     def get_possible_moves(self, cell):
         '''Returns a list of the valid moves for a cell.'''
-        possible_moves = [num for num in range(1, 10)]
+        values = self.values
+        used = {values[peer] for peer in self.topology.peers[cell.index]}
+        return [num for num in range(1, self.topology.size + 1) if num not in used]
+
+    def get_empty_cell(self):
+        '''Returns an empty cell. Returns False if all cells are filled in.'''
+        index = self.values.find(0)
+        if index == -1:
+            return False
+        return self.board[index // self.topology.size][index % self.topology.size]
+
+    def solve(self, engine='bitmask'):
+        '''
+        Solves the game from it's current state with the chosen solver engine.
+        Returns True if successful and False if not solvable.
+        '''
+        if engine == 'backtrack':
+            return self._backtrack()
 
-        # Check numbers in the row
-        for col in range(9):
-            if self.board[cell.row][col].value in possible_moves:
-                possible_moves.remove(self.board[cell.row][col].value)
+        solution = self._find_solution(engine)
+        if solution is None:
+            return False
 
-        # Check numbers in the column
-        for row in range(9):
-            if self.board[row][cell.col].value in possible_moves:
-                possible_moves.remove(self.board[row][cell.col].value)
+        # Copy the solution back into the board
+        self._assign(solution)
 
-        # Check numbers in the box
-        for row in range(cell.row // 3 * 3, cell.row // 3 * 3 + 3):
-            for col in range(cell.col // 3 * 3, cell.col // 3 * 3 + 3):
-                if self.board[row][col].value in possible_moves:
-                    possible_moves.remove(self.board[row][col].value)
+        return True
 
-        return possible_moves
+    def _find_solution(self, engine, budget=None):
+        '''
+        Returns a solution found by an engine as a flat list of values
+        without changing the board. Returns None if not solvable.
+        If a Budget is given BudgetExhausted is raised once it runs out.
+        '''
+        if engine == 'bitmask':
+            if budget is None:
+                solver = BitmaskSolver(self._grid())
+            else:
+                solver = _BudgetedBitmaskSolver(self._grid(), budget)
+            return solver.grid if solver.solve() else None
+        if engine == 'dlx':
+            if budget is None:
+                solver = DancingLinks(self._grid())
+            else:
+                solver = _BudgetedDancingLinks(self._grid(), budget)
+            return next(solver.solutions(), None)
+        if engine == 'backtrack':
+            # Search a copy so an exhausted budget leaves this board untouched
+            if budget is None:
+                game = Sudoku._from_buffers(self.values, self.givens)
+            else:
+                game = _BudgetedSudoku._from_buffers(self.values, self.givens)
+                game.budget = budget
+            return list(game.values) if game._backtrack() else None
+        raise ValueError(f'Unknown solver engine: {engine}')
 
-    def get_empty_cell(self):
-        '''Returns an empty cell. Returns False if all cells are filled in.'''
-        for row in range(9):
-            for col in range(9):
-                if self.board[row][col].value is None:
-                    return self.board[row][col]
+    def solve_within(self, engine='bitmask', timeout=None, max_nodes=None, cancel=None):
+        '''
+        Solves the game like solve but gives up after timeout seconds,
+        max_nodes search nodes or once the CancelToken cancel is cancelled.
+        Returns SOLVED, UNSOLVABLE or EXHAUSTED. The board is only changed if solved.
+        '''
+        try:
+            solution = self._find_solution(engine, Budget(timeout, max_nodes, cancel))
+        except BudgetExhausted:
+            return EXHAUSTED
+        if solution is None:
+            return UNSOLVABLE
+        self._assign(solution)
+        return SOLVED
 
-        return False
+    def test_solve_within(self, engine='bitmask', timeout=None, max_nodes=None, cancel=None):
+        '''
+        Checks if the current configuration is solvable within a budget like
+        solve_within without changing the board. Returns SOLVED, UNSOLVABLE or EXHAUSTED.
+        '''
+        try:
+            solution = self._find_solution(engine, Budget(timeout, max_nodes, cancel))
+        except BudgetExhausted:
+            return EXHAUSTED
+        return UNSOLVABLE if solution is None else SOLVED
 
-    def solve(self):
+    def _backtrack(self):
         '''
-        Solves the game from it's current state with a backtracking algorithm.
+        Reference engine that solves the game with a naive backtracking algorithm.
         Returns True if successful and False if not solvable.
         '''
         cell = self.get_empty_cell()
@@ -144,7 +486,7 @@ class Sudoku:
             return True
 
         # Check each possible value in cell
-        for val in range(1, 10):
+        for val in range(1, self.topology.size + 1):
 
             # Check if the value is a valid move
             if not self.check_move(cell, val):
@@ -154,7 +496,7 @@ class Sudoku:
             cell.value = val
 
             # If all recursive calls return True then board is solved
-            if self.solve():
+            if self._backtrack():
                 return True
 
             # Undo move is solve was unsuccessful
@@ -163,46 +505,629 @@ class Sudoku:
         # No moves were successful
         return False
 
+    def solve_steps(self):
+        '''
+        Solves the game with the same backtracking algorithm as the reference
+        engine, yielding a Step for every value placed, rejected or taken back.
+        An explicit stack is used so the caller can stop at any point.
+        '''
+        values = self.values
+        counts = self._counts
+        cell_units = self.topology.cell_units
+        stride = self.topology.size + 1
+        stack = []
+        index = values.find(0)
+        start = 1
+        while index != -1:
+            units = cell_units[index]
+            for value in range(start, stride):
+                # The value is allowed if none of the cell's units hold it
+                if not (
+                    counts[units[0] * stride + value]
+                    or counts[units[1] * stride + value]
+                    or counts[units[2] * stride + value]
+                ):
+                    self.set_value(index, value)
+                    yield Step('place', index, value)
+                    stack.append(index)
+                    index = values.find(0)
+                    start = 1
+                    break
+                yield Step('reject', index, value)
+            else:
+                # No value fits so take back the previous placement
+                if not stack:
+                    yield Step('failed', None, None)
+                    return
+                index = stack.pop()
+                value = values[index]
+                start = value + 1
+                self.set_value(index, 0)
+                yield Step('backtrack', index, value)
+
+        yield Step('solved', None, None)
+
+    def count_solutions(self, limit=None):
+        '''
+        Returns the number of solutions of the current configuration.
+        Counting stops once limit solutions have been found.
+        '''
+        return DancingLinks(self._grid()).count_solutions(limit)
+
+    def iter_solutions(self):
+        '''Yields every solution of the current configuration as a list of rows.'''
+        size = self.topology.size
+        for solution in DancingLinks(self._grid()).solutions():
+            yield [solution[row * size:row * size + size] for row in range(size)]
+
+    def has_unique_solution(self):
+        '''Returns whether the current configuration has exactly one solution.'''
+        return self.count_solutions(limit=2) == 1
+
+    def _grid(self):
+        '''Returns the board as a flat list of values with 0 for empty cells.'''
+        return list(self.values)
+
     def get_board(self):
         '''Returns a list of values that are in the Sudoku board.'''
-        return [[self.board[row][col].value for col in range(9)] for row in range(9)]
+        values = self.values
+        size = self.topology.size
+        return [[values[row * size + col] or None for col in range(size)] for row in range(size)]
 
-    def test_solve(self):
+    def test_solve(self, engine='bitmask'):
         '''Checks if the current configuration is solvable.'''
-        current_board = self.get_board()
-        solvable = self.solve()
+        if engine != 'backtrack':
+            return self._find_solution(engine) is not None
+
+        current_board = self.snapshot()
+        solvable = self.solve(engine)
 
         # Reset board to state before solve check
-        for row in range(9):
-            for col in range(9):
-                self.board[row][col].value = current_board[row][col]
+        self.restore(current_board)
 
         return solvable
 
     def reset(self):
         '''Resets the game to its starting state.'''
-        for row in self.board:
-            for cell in row:
-                if cell.editable:
-                    cell.value = None
+        self._assign(self.givens)
 
     def __str__(self):
         '''Returns a string representing the board.'''
-        board = ' -----------------------\n'
-        for row, line in enumerate(self.board):
+        box, size = self.topology.box, self.topology.size
+        border = ' ' + '-' * (box * (box * 2 + 2) - 1) + '\n'
+        board = border
+        for row, line in enumerate(self.get_board()):
             board += '|'
-            for col, cell in enumerate(line):
-                if cell.value is None:
+            for col, value in enumerate(line):
+                if value is None:
                     val = '-'
                 else:
-                    val = cell.value
-                if col < 8:
+                    val = DIGIT_CHARS[value - 1]
+                if col < size - 1:
                     board += f' {val}'
-                    if (col + 1) % 3 == 0:
+                    if (col + 1) % box == 0:
                         board += ' |'
                 else:
                     board += f' {val} |\n'
-            if row < 8 and (row + 1) % 3 == 0:
-                board += '|-------|-------|-------|\n'
-        board += ' -----------------------\n'
+            if row < size - 1 and (row + 1) % box == 0:
+                board += '|' + '|'.join(['-' * (box * 2 + 1)] * box) + '|\n'
+        board += border
         return board
+
+
+class CancelToken:
+    '''Lets another thread ask a running solve to stop.'''
+
+    def __init__(self, event=None):
+        '''
+        Initializes a token that has not been cancelled. Passing a
+        multiprocessing.Event shares the token between processes.
+        '''
+        self._event = event if event is not None else threading.Event()
+
+    def cancel(self):
+        '''Asks every solve using this token to stop.'''
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        '''Getter method for cancelled.'''
+        return self._event.is_set()
+
+
+class BudgetExhausted(Exception):
+    '''Raised inside a budgeted solve once its budget has run out.'''
+
+
+class Budget:
+    '''Limits a solve by a deadline, a number of search nodes and a cancel token.'''
+
+    def __init__(self, timeout=None, max_nodes=None, cancel=None):
+        '''Initializes a budget starting now. Limits that are None are not enforced.'''
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.max_nodes = max_nodes
+        self.cancel = cancel
+        self.nodes = 0
+
+    def spend(self):
+        '''Spends one search node, raising BudgetExhausted if the budget has run out.'''
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise BudgetExhausted('Node budget exhausted.')
+        if self.cancel is not None and self.cancel.cancelled:
+            raise BudgetExhausted('Solve was cancelled.')
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise BudgetExhausted('Deadline passed.')
+
+
+def grid_to_string(grid):
+    '''Returns a flat grid as a puzzle string with '.' for empty cells.'''
+    return ''.join(DIGIT_CHARS[value - 1] if value else '.' for value in grid)
+
+
+def check_sudoku(sudoku):
+    '''
+    Takes a complete instance of Soduku and 
+    returns whether or not the solution is valid.
+    '''
+    # Ensure all cells are filled
+    if 0 in sudoku.values:
+        raise ValueError('Game is not complete')
+
+    # Will hold values for each row, column, and box
+    topology = sudoku.topology
+    row_sets = [set() for _ in range(topology.size)]
+    col_sets = [set() for _ in range(topology.size)]
+    box_sets = [set() for _ in range(topology.size)]
+
+    # Check all rows, columns, and boxes contain no duplicates
+    for index, value in enumerate(sudoku.values):
+        row, col, box = topology.row_of[index], topology.col_of[index], topology.box_of[index]
+
+        # Check if number already encountered in row, column, or box
+        if value in row_sets[row] or value in col_sets[col] or value in box_sets[box]:
+            return False
+
+        # Add value to corresponding set
+        row_sets[row].add(value)
+        col_sets[col].add(value)
+        box_sets[box].add(value)
+
+    # All rows, columns, and boxes are valid
+    return True
+
+
+class BitmaskSolver:
+    '''
+    Solver engine that keeps the digits used by every row, column and box as
+    bitmasks. The search always branches on the most constrained cell and
+    fills in naked and hidden singles before each branch.
+    '''
+
+    def __init__(self, grid, rng=None):
+        '''
+        Initializes the solver from a flat list of values, 81 for the
+        standard board, where empty cells are 0 or None. If rng is a
+        random.Random the digits of each branch are tried in random order.
+        '''
+        self.grid = [value or 0 for value in grid]
+        self.rng = rng
+        self.topology = topology_of(len(self.grid))
+        self.row_of = self.topology.row_of
+        self.col_of = self.topology.col_of
+        self.box_of = self.topology.box_of
+        self.all_digits = self.topology.all_digits
+        self.rows = [0] * self.topology.size
+        self.cols = [0] * self.topology.size
+        self.boxes = [0] * self.topology.size
+        self.found = [0] * len(self.grid)
+        self.valid = True
+
+        for index, value in enumerate(self.grid):
+            if not value:
+                continue
+            bit = 1 << (value - 1)
+            if (
+                self.rows[self.row_of[index]]
+                | self.cols[self.col_of[index]]
+                | self.boxes[self.box_of[index]]
+            ) & bit:
+                self.valid = False
+            self._place(index, value)
+
+    def _place(self, index, value):
+        '''Places a value in a cell and marks it used in the cell's units.'''
+        bit = 1 << (value - 1)
+        self.grid[index] = value
+        self.rows[self.row_of[index]] |= bit
+        self.cols[self.col_of[index]] |= bit
+        self.boxes[self.box_of[index]] |= bit
+
+    def _remove(self, index):
+        '''Removes the value from a cell and frees it in the cell's units.'''
+        bit = ~(1 << (self.grid[index] - 1))
+        self.grid[index] = 0
+        self.rows[self.row_of[index]] &= bit
+        self.cols[self.col_of[index]] &= bit
+        self.boxes[self.box_of[index]] &= bit
+
+    def candidates(self, index):
+        '''Returns the bitmask of digits that can be placed in a cell.'''
+        return self.all_digits & ~(
+            self.rows[self.row_of[index]]
+            | self.cols[self.col_of[index]]
+            | self.boxes[self.box_of[index]]
+        )
+
+    def _propagate(self, trail):
+        '''
+        Fills in naked and hidden singles until none are left, recording
+        every placement in trail. Returns False if a contradiction is found.
+        '''
+        grid = self.grid
+        all_digits = self.all_digits
+        rows, cols, boxes = self.rows, self.cols, self.boxes
+        row_of, col_of, box_of = self.row_of, self.col_of, self.box_of
+        found = self.found
+        changed = True
+        while changed:
+            changed = False
+
+            # Naked singles: cells with only one candidate left
+            for index in range(len(grid)):
+                if grid[index]:
+                    continue
+                candidates = all_digits & ~(
+                    rows[row_of[index]] | cols[col_of[index]] | boxes[box_of[index]]
+                )
+                if not candidates:
+                    return False
+                if not candidates & (candidates - 1):
+                    self._place(index, candidates.bit_length())
+                    trail.append(index)
+                    changed = True
+                found[index] = candidates
+
+            # Hidden singles: digits with only one place left in a unit. The
+            # candidates found above can only have shrunk since, so a single
+            # they show is checked against the current candidates
+            for unit in self.topology.units:
+                once = twice = placed = 0
+                for index in unit:
+                    if grid[index]:
+                        placed |= 1 << (grid[index] - 1)
+                    else:
+                        candidates = found[index]
+                        twice |= once & candidates
+                        once |= candidates
+
+                # Every digit must have somewhere to go
+                if (once | placed) != all_digits:
+                    return False
+
+                singles = once & ~twice & ~placed
+                while singles:
+                    bit = singles & -singles
+                    singles ^= bit
+                    for index in unit:
+                        if not grid[index] and self.candidates(index) & bit:
+                            break
+                    else:
+                        # An earlier single in this unit took the last spot
+                        return False
+                    self._place(index, bit.bit_length())
+                    trail.append(index)
+                    changed = True
+
+        return True
+
+    def _select(self):
+        '''
+        Returns the empty cell with the fewest candidates and its candidates.
+        Returns None if all cells are filled in.
+        '''
+        grid = self.grid
+        best = None
+        best_count = self.topology.size + 1
+        bit_count = self.topology.bit_count
+        all_digits = self.all_digits
+        rows, cols, boxes = self.rows, self.cols, self.boxes
+        row_of, col_of, box_of = self.row_of, self.col_of, self.box_of
+        for index in range(len(grid)):
+            if grid[index]:
+                continue
+            candidates = all_digits & ~(
+                rows[row_of[index]] | cols[col_of[index]] | boxes[box_of[index]]
+            )
+            count = bit_count(candidates)
+            if count < best_count:
+                best = (index, candidates)
+                best_count = count
+                if count <= 1:
+                    break
+        return best
+
+    def _search(self):
+        '''Recursively searches for a solution from the current grid.'''
+        trail = []
+        if self._propagate(trail):
+            choice = self._select()
+
+            # Grid is complete if no empty cell is left
+            if choice is None:
+                return True
+
+            index, candidates = choice
+            digits = self.topology.digits(candidates)
+            if self.rng is not None:
+                digits = self.rng.sample(digits, len(digits))
+            for digit in digits:
+                self._place(index, digit)
+                if self._search():
+                    return True
+                self._remove(index)
+
+        # Undo everything propagated at this level
+        for index in reversed(trail):
+            self._remove(index)
+        return False
+
+    def solve(self):
+        '''
+        Solves the grid in place. Returns True if successful and False if
+        the grid is not solvable.
+        '''
+        if not self.valid:
+            return False
+        return self._search()
+
+    def split(self, depth=1):
+        '''
+        Splits the search into the grids reached by branching depth times on
+        the most constrained cell, filling in singles before each branch like
+        the search does. Together the grids hold every solution of the grid.
+        Branches that are solved early are kept and dead ends are left out.
+        '''
+        grids = []
+        if self.valid:
+            self._split(depth, grids)
+        return grids
+
+    def _split(self, depth, grids):
+        '''Adds the grids of the branches below the current grid to grids.'''
+        trail = []
+        if self._propagate(trail):
+            choice = self._select()
+            if choice is None or not depth:
+                grids.append(list(self.grid))
+            else:
+                index, candidates = choice
+                for digit in self.topology.digits(candidates):
+                    self._place(index, digit)
+                    self._split(depth - 1, grids)
+                    self._remove(index)
+        for index in reversed(trail):
+            self._remove(index)
+
+
+class DancingLinks:
+    '''
+    Solver engine that models Sudoku as an exact cover problem, with 324
+    constraints and 729 candidate rows on the standard board, solved with
+    Knuth's Dancing Links.
+    '''
+
+    def __init__(self, grid):
+        '''
+        Initializes the links from a flat list of values, 81 for the standard
+        board, where empty cells are 0 or None.
+        '''
+        grid = [value or 0 for value in grid]
+        topology = self.topology = topology_of(len(grid))
+        size, cells = topology.size, topology.cells
+
+        # Node 0 is the root and the next 4 * cells nodes are the column headers
+        # for the cell, row digit, column digit and box digit constraints
+        columns = cells * 4
+        self.left = [columns] + list(range(columns))
+        self.right = list(range(1, columns + 1)) + [0]
+        self.up = list(range(columns + 1))
+        self.down = list(range(columns + 1))
+        self.column = list(range(columns + 1))
+        self.size = [0] * (columns + 1)
+        self.candidate = [None] * (columns + 1)
+
+        # Digits already used by the givens of each row, column and box
+        used = BitmaskSolver(grid)
+        self.grid = grid
+        self.valid = used.valid
+
+        given_rows = []
+        for index, value in enumerate(grid):
+            if value:
+                digits = [value]
+            else:
+                digits = topology.digits(used.candidates(index))
+            for digit in digits:
+                row = self._add_row(index * size + digit - 1, (
+                    index,
+                    cells + topology.row_of[index] * size + digit - 1,
+                    cells * 2 + topology.col_of[index] * size + digit - 1,
+                    cells * 3 + topology.box_of[index] * size + digit - 1,
+                ))
+                if value:
+                    given_rows.append(row)
+
+        # Choose the givens up front so the search only recurses on empty cells
+        if self.valid:
+            for row in given_rows:
+                self._cover(self.column[row])
+                node = self.right[row]
+                while node != row:
+                    self._cover(self.column[node])
+                    node = self.right[node]
+
+    def _add_row(self, candidate, constraints):
+        '''
+        Adds a candidate row with a node in each of its constraint columns.
+        Returns the first node of the row.
+        '''
+        first = len(self.column)
+        for offset, constraint in enumerate(constraints):
+            node = first + offset
+            header = constraint + 1
+
+            # Link into the bottom of the column
+            self.column.append(header)
+            self.candidate.append(candidate)
+            self.up.append(self.up[header])
+            self.down.append(header)
+            self.down[self.up[header]] = node
+            self.up[header] = node
+            self.size[header] += 1
+
+            # Link into the circular row
+            self.left.append(node - 1 if offset else first + len(constraints) - 1)
+            self.right.append(node + 1 if offset < len(constraints) - 1 else first)
+        return first
+
+    def _cover(self, header):
+        '''Removes a column and every row that satisfies it.'''
+        left, right, up, down = self.left, self.right, self.up, self.down
+        right[left[header]] = right[header]
+        left[right[header]] = left[header]
+        row = down[header]
+        while row != header:
+            node = right[row]
+            while node != row:
+                down[up[node]] = down[node]
+                up[down[node]] = up[node]
+                self.size[self.column[node]] -= 1
+                node = right[node]
+            row = down[row]
+
+    def _uncover(self, header):
+        '''Restores a column removed by _cover.'''
+        left, right, up, down = self.left, self.right, self.up, self.down
+        row = up[header]
+        while row != header:
+            node = left[row]
+            while node != row:
+                self.size[self.column[node]] += 1
+                down[up[node]] = node
+                up[down[node]] = node
+                node = left[node]
+            row = up[row]
+        right[left[header]] = header
+        left[right[header]] = header
+
+    def _choose_column(self):
+        '''Returns the uncovered column with the fewest remaining rows.'''
+        right, size = self.right, self.size
+        header = right[0]
+        best = header
+        while header:
+            if size[header] < size[best]:
+                best = header
+            header = right[header]
+        return best
+
+    def _search(self, chosen):
+        '''Yields chosen once for every exact cover reachable from here.'''
+        right = self.right
+
+        # Every constraint is satisfied
+        if right[0] == 0:
+            yield chosen
+            return
+
+        # Branch on the column with the fewest remaining rows
+        best = self._choose_column()
+        if not self.size[best]:
+            return
+
+        self._cover(best)
+        try:
+            row = self.down[best]
+            while row != best:
+                chosen.append(self.candidate[row])
+                node = right[row]
+                while node != row:
+                    self._cover(self.column[node])
+                    node = right[node]
+                try:
+                    yield from self._search(chosen)
+                finally:
+                    # Restore the links even if the caller stops early
+                    node = self.left[row]
+                    while node != row:
+                        self._uncover(self.column[node])
+                        node = self.left[node]
+                    chosen.pop()
+                row = self.down[row]
+        finally:
+            self._uncover(best)
+
+    def solutions(self):
+        '''Yields every solution as a flat list of values.'''
+        if not self.valid:
+            return
+        size = self.topology.size
+        for chosen in self._search([]):
+            grid = list(self.grid)
+            for candidate in chosen:
+                grid[candidate // size] = candidate % size + 1
+            yield grid
+
+    def count_solutions(self, limit=None):
+        '''
+        Returns the number of solutions. Counting stops once limit
+        solutions have been found.
+        '''
+        if not self.valid:
+            return 0
+        count = 0
+        search = self._search([])
+        for _ in search:
+            count += 1
+            if limit is not None and count >= limit:
+                search.close()
+                break
+        return count
+
+
+class _BudgetedBitmaskSolver(BitmaskSolver):
+    '''Bitmask engine that spends a Budget on every search node.'''
+
+    def __init__(self, grid, budget):
+        super().__init__(grid)
+        self.budget = budget
+
+    def _search(self):
+        self.budget.spend()
+        return super()._search()
+
+
+class _BudgetedDancingLinks(DancingLinks):
+    '''
+    Dancing Links engine that spends a Budget on every search node. The budget
+    is spent when a column is chosen so the recursion does not get deeper.
+    '''
+
+    def __init__(self, grid, budget):
+        super().__init__(grid)
+        self.budget = budget
+
+    def _choose_column(self):
+        self.budget.spend()
+        return super()._choose_column()
+
+
+class _BudgetedSudoku(Sudoku):
+    '''Reference backtracking engine that spends a Budget on every search node.'''
+
+    __slots__ = ('budget',)
+
+    def _backtrack(self):
+        self.budget.spend()
+        return super()._backtrack()
@@ -0,0 +1,312 @@
+import argparse
+from collections import namedtuple
+from functools import lru_cache
+import mmap
+import struct
+import sys
+from history import History
+from solver import DIGIT_CHARS, PUZZLE_LENGTHS, Sudoku, grid_to_string, topology_of
+
+
+# Digits of the base a board is packed in, the value of a cell is its digit
+BASE_CHARS = '0123456789abcdefghijklmnop'
+
+# Puzzle string characters to base digits and back
+_TO_BASE = str.maketrans('.' + DIGIT_CHARS, BASE_CHARS)
+_FROM_BASE = str.maketrans(BASE_CHARS, '.' + DIGIT_CHARS)
+
+# Saved games start with the magic bytes, the number of cells and flags
+# telling whether pencil marks and a history follow the board
+GAME_HEADER = struct.Struct('<4sHB')
+GAME_MAGIC = b'SDS1'
+HAS_MARKS = 1
+HAS_HISTORY = 2
+
+# Pencil marks are stored as the number of cells with marks ruled out,
+# followed by the index and ruled out digits bitmask of every one of them
+MARK_COUNT = struct.Struct('<H')
+MARK = struct.Struct('<HI')
+
+# Collection files start with the magic bytes, the number of cells of its
+# boards, the size of a packed board and the number of boards
+COLLECTION_HEADER = struct.Struct('<4sHHI')
+COLLECTION_MAGIC = b'SDC1'
+
+SavedGame = namedtuple('SavedGame', ['game', 'eliminated', 'history'])
+SavedGame.__doc__ = '''
+A game loaded by load_game. eliminated is a list holding the bitmask of the
+digits ruled out of the pencil marks of every cell, or None if the marks
+were not saved, and history is the History of the game or None.
+'''
+
+
+@lru_cache(maxsize=None)
+def packed_size(cells):
+    '''Returns the number of bytes a board with the given number of cells is packed in.'''
+    base = topology_of(cells).size + 1
+    return ((base ** cells - 1).bit_length() + 7) // 8
+
+
+def pack_puzzle(text):
+    '''
+    Packs a puzzle string into bytes by reading its cells as the digits of
+    one number in base size + 1. A 9x9 board takes 34 bytes.
+    '''
+    text = text.strip().upper()
+    cells = len(text)
+    if cells not in PUZZLE_LENGTHS:
+        raise ValueError('Puzzle must be 81 characters long, or 16, 256 or 625 for the variants.')
+    size = topology_of(cells).size
+
+    # int() would also accept signs and underscores, so the characters are checked first
+    if not set(text) <= _allowed_chars(size):
+        raise ValueError(f'Invalid character in puzzle: {text!r}')
+    number = int(text.translate(_TO_BASE), size + 1)
+    return number.to_bytes(packed_size(cells), 'big')
+
+
+@lru_cache(maxsize=None)
+def _allowed_chars(size):
+    '''Returns the characters a puzzle string of a board with the given size may hold.'''
+    return frozenset('.0' + DIGIT_CHARS[:size])
+
+
+def unpack_puzzle(data, cells=81):
+    '''Returns the puzzle string of a board packed by pack_puzzle.'''
+    base = topology_of(cells).size + 1
+    number = int.from_bytes(data, 'big')
+    if number >= base ** cells:
+        raise ValueError('Packed board is corrupted.')
+    if base == 10:
+        digits = str(number)
+    else:
+        places = bytearray(cells)
+        for position in range(cells - 1, -1, -1):
+            number, digit = divmod(number, base)
+            places[position] = ord(BASE_CHARS[digit])
+        digits = places.decode()
+    return digits.rjust(cells, '0').translate(_FROM_BASE)
+
+
+def pack_values(values):
+    '''Packs a flat list of cell values, with 0 or None for empty cells, like pack_puzzle.'''
+    return pack_puzzle(grid_to_string(value or 0 for value in values))
+
+
+def unpack_values(data, cells=81):
+    '''Returns the flat bytes of cell values of a board packed by pack_values.'''
+    return bytes(DIGIT_CHARS.find(char) + 1 for char in unpack_puzzle(data, cells))
+
+
+def to_text(game):
+    '''
+    Returns the text form of a game: its puzzle string of givens, followed
+    by a space and a puzzle string of the player's entries if there are any.
+    A game without entries is a plain puzzle string.
+    '''
+    entries = [0 if given else value for value, given in zip(game.values, game.givens)]
+    text = grid_to_string(game.givens)
+    if any(entries):
+        text += ' ' + grid_to_string(entries)
+    return text
+
+
+def from_text(text):
+    '''Creates a game from its text form, which may be a plain puzzle string.'''
+    puzzle, _, entries = text.strip().partition(' ')
+    game = Sudoku.from_string(puzzle)
+    if entries:
+        entries = Sudoku.from_string(entries).values
+        if len(entries) != len(game.values):
+            raise ValueError('Entries must cover the same board as the puzzle.')
+        for index, value in enumerate(entries):
+            if value and game.givens[index]:
+                raise ValueError(f'Entry at cell {index} covers a given.')
+            if value:
+                game.set_value(index, value)
+    return game
+
+
+def save_game(game, eliminated=None, history=None):
+    '''
+    Returns a game as bytes: the packed givens and entries, then the digits
+    ruled out of the pencil marks of every cell if eliminated is given, then
+    the history if one is given.
+    '''
+    cells = len(game.values)
+    flags = (HAS_MARKS if eliminated is not None else 0) | (HAS_HISTORY if history is not None else 0)
+    parts = [
+        GAME_HEADER.pack(GAME_MAGIC, cells, flags),
+        pack_values(game.givens),
+        pack_values(0 if given else value for value, given in zip(game.values, game.givens)),
+    ]
+    if eliminated is not None:
+        marks = [(index, mask) for index, mask in enumerate(eliminated) if mask]
+        parts.append(MARK_COUNT.pack(len(marks)))
+        parts.extend(MARK.pack(index, mask) for index, mask in marks)
+    if history is not None:
+        parts.append(history.to_bytes())
+    return b''.join(parts)
+
+
+def load_game(data):
+    '''Returns the SavedGame held by bytes from save_game.'''
+    try:
+        magic, cells, flags = GAME_HEADER.unpack_from(data)
+    except struct.error:
+        raise ValueError('Data is too short to be a saved game.')
+    if magic != GAME_MAGIC:
+        raise ValueError('Data is not a saved game.')
+    topology = topology_of(cells)
+    size = packed_size(cells)
+    offset = GAME_HEADER.size
+
+    # A short slice would still unpack, to a different board
+    if len(data) < offset + size * 2:
+        raise ValueError('Saved game is corrupted.')
+    givens = unpack_values(data[offset:offset + size], cells)
+    entries = unpack_values(data[offset + size:offset + size * 2], cells)
+    offset += size * 2
+    for given, entry in zip(givens, entries):
+        if (given and entry) or given > topology.size or entry > topology.size:
+            raise ValueError('Saved game is corrupted.')
+
+    eliminated = None
+    if flags & HAS_MARKS:
+        eliminated = [0] * cells
+        try:
+            count, = MARK_COUNT.unpack_from(data, offset)
+        except struct.error:
+            raise ValueError('Saved game is corrupted.')
+        offset += MARK_COUNT.size
+        if len(data) < offset + count * MARK.size:
+            raise ValueError('Saved game is corrupted.')
+        for index, mask in MARK.iter_unpack(data[offset:offset + count * MARK.size]):
+            if index >= cells or mask > topology.all_digits:
+                raise ValueError('Saved game is corrupted.')
+            eliminated[index] = mask
+        offset += count * MARK.size
+
+    # Without a history the marks are the last part of the save
+    if not flags & HAS_HISTORY and len(data) != offset:
+        raise ValueError('Saved game is corrupted.')
+
+    values = bytes(given or entry for given, entry in zip(givens, entries))
+    if flags & HAS_HISTORY:
+        game, history = History.from_bytes(data[offset:])
+        if game.givens != givens or game.values != values:
+            raise ValueError('Saved game does not match its history.')
+    else:
+        game, history = Sudoku._from_buffers(values, givens), None
+    return SavedGame(game, eliminated, history)
+
+
+def is_collection(path):
+    '''Returns whether the file at path is a puzzle collection.'''
+    with open(path, 'rb') as file:
+        return file.read(len(COLLECTION_MAGIC)) == COLLECTION_MAGIC
+
+
+def write_collection(path, puzzles):
+    '''
+    Packs puzzle strings into a collection file. All the puzzles must have
+    the same size. Returns the number of puzzles written.
+    '''
+    count = 0
+    cells = None
+    with open(path, 'wb') as file:
+        file.write(COLLECTION_HEADER.pack(COLLECTION_MAGIC, 0, 0, 0))
+        for puzzle in puzzles:
+            puzzle = puzzle.strip()
+            if cells is None:
+                cells = len(puzzle)
+            elif len(puzzle) != cells:
+                raise ValueError(f'Puzzle {count} does not have {cells} cells like the first one.')
+            file.write(pack_puzzle(puzzle))
+            count += 1
+        file.seek(0)
+        cells = cells or 81
+        file.write(COLLECTION_HEADER.pack(COLLECTION_MAGIC, cells, packed_size(cells), count))
+    return count
+
+
+class PuzzleCollection:
+    '''
+    A file of packed puzzles of the same size. The file is memory mapped and
+    every puzzle takes the same number of bytes, so any puzzle is read by
+    its index without reading the ones before it.
+    '''
+
+    def __init__(self, path):
+        '''Opens the collection file at path.'''
+        self.file = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, self.cells, self.record_size, self.count = COLLECTION_HEADER.unpack_from(self.data)
+        except (ValueError, struct.error):
+            self.file.close()
+            raise ValueError(f'{path} is not a puzzle collection.')
+        if magic != COLLECTION_MAGIC or len(self.data) != COLLECTION_HEADER.size + self.count * self.record_size:
+            self.close()
+            raise ValueError(f'{path} is not a puzzle collection.')
+
+    def close(self):
+        '''Closes the collection file.'''
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def packed(self, index):
+        '''Returns the packed bytes of the puzzle at index.'''
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('Puzzle index out of range.')
+        start = COLLECTION_HEADER.size + index * self.record_size
+        return self.data[start:start + self.record_size]
+
+    def __getitem__(self, index):
+        '''Returns the puzzle string at index.'''
+        return unpack_puzzle(self.packed(index), self.cells)
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
+
+    def game(self, index):
+        '''Returns a new game of the puzzle at index.'''
+        return Sudoku.from_string(self[index])
+
+
+def main(argv=None):
+    '''Command line entry point for converting between puzzle files and collections.'''
+    parser = argparse.ArgumentParser(
+        description='Pack a file of puzzle strings into a collection, or unpack a collection.'
+    )
+    parser.add_argument('input', help='file of puzzle strings, one per line, or a collection')
+    parser.add_argument('-o', '--output', required=True,
+                        help='collection to write for a puzzle file, puzzle file for a collection')
+    args = parser.parse_args(argv)
+
+    if is_collection(args.input):
+        with PuzzleCollection(args.input) as collection, open(args.output, 'w') as file:
+            for puzzle in collection:
+                file.write(puzzle + '\n')
+            count = len(collection)
+    else:
+        with open(args.input) as file:
+            puzzles = (line for line in file if line.strip() and not line.startswith('#'))
+            count = write_collection(args.output, puzzles)
+    print(f'{count} puzzles written to {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
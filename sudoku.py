@@ -1,23 +1,32 @@
+import os
 import pygame
+import random
 import sys
-import time
-from solver import Cell, Sudoku
-
-
-pygame.init()
-
-# Set size of game and other constants
-cell_size = 50
-minor_grid_size = 1
-major_grid_size = 3
-buffer = 5
-button_height = 50
-button_width = 125
-button_border = 2
-width = cell_size*9 + minor_grid_size*6 + major_grid_size*4 + buffer*2
-height = cell_size*9 + minor_grid_size*6 + \
-    major_grid_size*4 + button_height + buffer*3 + button_border*2
-size = width, height
+from generator import PuzzlePool
+from history import History
+from layout import (
+    RectCell, buffer, button_border, button_height, button_lefts, button_top, button_width,
+    cell_size, create_cells, geometry, major_grid_size, minor_grid_size, size, status_area,
+)
+from logic import DIFFICULTIES, CandidateGrid, describe, next_deduction
+from solver import DIGIT_CHARS, DIGITS_OF, Cell, Sudoku, check_sudoku
+from storage import PuzzleCollection, is_collection, load_game, save_game
+
+
+__all__ = [
+    # Names that moved to layout.py and solver.py, still importable from here
+    'Cell', 'RectCell', 'Sudoku', 'buffer', 'button_border', 'button_height', 'button_width',
+    'cell_size', 'check_sudoku', 'create_cells', 'major_grid_size', 'minor_grid_size', 'size',
+    # Drawing and playing the game
+    'white', 'black', 'gray', 'green', 'red', 'inactive_btn', 'active_btn', 'blue',
+    'hint_background', 'digit_colors', 'mark_color', 'screen', 'open_window', 'GlyphCache',
+    'glyphs', 'value_keys', 'draw_grid', 'cell_style', 'draw_cell', 'fill_cells', 'draw_button',
+    'draw_board', 'DirtyRenderer', 'draw_status', 'draw_cells', 'button_rect', 'draw_buttons',
+    'draw_status_strip', 'get_events', 'VisualSolve', 'play',
+]
+
+
+# Colors used by the game
 white = 255, 255, 255
 black = 0, 0, 0
 gray = 200, 200, 200
@@ -25,117 +34,191 @@ green = 0, 175, 0
 red = 200, 0, 0
 inactive_btn = 51, 255, 255
 active_btn = 51, 153, 255
+blue = 0, 90, 255
+hint_background = 255, 245, 180
 
-screen = pygame.display.set_mode(size)
-pygame.display.set_caption('Sudoku')
+# Colors used to draw the digits of each cell style
+digit_colors = {'given': black, 'valid': green, 'conflict': red}
+mark_color = 120, 120, 120
 
+# Game window, opened by open_window when the game starts
+screen = None
 
-class RectCell(pygame.Rect):
+
+def open_window():
     '''
-    A class built upon the pygame Rect class used to represent individual cells in the game.
-    This class has a few extra attributes not contained within the base Rect class.
+    Starts the display and font subsystems and opens the game window.
+    Importing this module has no side effects, so nothing is initialized
+    until a game is played. Returns the window surface.
     '''
+    global screen
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode(size)
+    pygame.display.set_caption('Sudoku')
+    return screen
 
-    def __init__(self, left, top, row, col):
-        super().__init__(left, top, cell_size, cell_size)
-        self.row = row
-        self.col = col
-
-
-def create_cells():
-    '''Creates all 81 cells with RectCell class.'''
-    cells = [[] for _ in range(9)]
-
-    # Set attributes for for first RectCell
-    row = 0
-    col = 0
-    left = buffer + major_grid_size
-    top = buffer + major_grid_size
-
-    while row < 9:
-        while col < 9:
-            cells[row].append(RectCell(left, top, row, col))
-
-            # Update attributes for next RectCell
-            left += cell_size + minor_grid_size
-            if col != 0 and (col + 1) % 3 == 0:
-                left = left + major_grid_size - minor_grid_size
-            col += 1
 
-        # Update attributes for next RectCell
-        top += cell_size + minor_grid_size
-        if row != 0 and (row + 1) % 3 == 0:
-            top = top + major_grid_size - minor_grid_size
-        left = buffer + major_grid_size
-        col = 0
-        row += 1
-
-    return cells
+class GlyphCache:
+    '''
+    Holds pre-rendered surfaces for every digit style, pencil mark, button
+    label and status message so drawing only has to blit them. The cache is
+    rebuilt whenever the cell size or colors it was built for change.
+    '''
 
+    labels = ('Reset', 'Visual Solve', 'Cancel', 'Hint')
+
+    def __init__(self):
+        '''Initializes an empty cache that is built on first use.'''
+        self.key = None
+        self.digits = {}
+        self.texts = {}
+
+    def ensure(self, cell_size, colors, size=9, digit_size=None):
+        '''
+        Rebuilds the cache if the cell size, colors or number of digits on the
+        board have changed. The digits are drawn in a digit_size font, which
+        by default keeps the proportion of the original 36 pt font to the cell.
+        '''
+        key = (cell_size, tuple(sorted(colors.items())), size, digit_size)
+        if key == self.key:
+            return
+        self.key = key
+
+        font = pygame.font.Font(None, digit_size or cell_size * 36 // 50)
+        self.digits = {}
+        for style, color in colors.items():
+            font.bold = style == 'given'
+            for value in range(1, size + 1):
+                self.digits[value, style] = font.render(DIGIT_CHARS[value - 1], 1, color)
+
+        # Pencil marks fit three to a row inside a cell
+        font = pygame.font.Font(None, cell_size * 18 // 50)
+        self.marks = {value: font.render(f'{value}', 1, mark_color) for value in range(1, 10)}
+
+        self.label_font = pygame.font.Font(None, 26)
+        self.status_font = pygame.font.Font(None, 28)
+        self.texts = {}
+        for label in self.labels:
+            self.text(label, black)
+
+    def digit(self, value, style):
+        '''Returns the surface for a digit drawn in a cell style.'''
+        if self.key is None:
+            self.ensure(cell_size, digit_colors)
+        return self.digits[value, style]
+
+    def mark(self, value):
+        '''Returns the surface for a pencil mark digit.'''
+        if self.key is None:
+            self.ensure(cell_size, digit_colors)
+        return self.marks[value]
+
+    def text(self, text, color, status=False):
+        '''Returns the surface for a button label or status message, rendering it once.'''
+        if self.key is None:
+            self.ensure(cell_size, digit_colors)
+        key = (text, color, status)
+        if key not in self.texts:
+            font = self.status_font if status else self.label_font
+            self.texts[key] = font.render(text, 1, color)
+        return self.texts[key]
+
+
+glyphs = GlyphCache()
+
+# Value entered by each key, None clears the cell. The letters A to P enter
+# the digits 10 to 25 on the larger boards
+value_keys = {
+    pygame.K_0: None, pygame.K_KP0: None, pygame.K_BACKSPACE: None, pygame.K_DELETE: None,
+}
+for value, char in enumerate(DIGIT_CHARS, 1):
+    value_keys[getattr(pygame, f'K_{char.lower()}')] = value
+for value in range(1, 10):
+    value_keys[getattr(pygame, f'K_KP{value}')] = value
+
+
+def draw_grid(surface, box=3, grid=None):
+    '''
+    Draws the major and minor grid lines for Sudoku, where the BoardGeometry
+    grid puts them, filling the board area of the window by default.
+    '''
+    grid = grid or geometry(box)
+    start, end = grid.origin, grid.end
 
-def draw_grid():
-    '''Draws the major and minor grid lines for Sudoku.'''
     # Draw minor grid lines
-    lines_drawn = 0
-    pos = buffer + major_grid_size + cell_size
-    while lines_drawn < 6:
-        pygame.draw.line(screen, black, (pos, buffer),
-                         (pos, width-buffer-1), minor_grid_size)
-        pygame.draw.line(screen, black, (buffer, pos),
-                         (width-buffer-1, pos), minor_grid_size)
-
-        # Update number of lines drawn
-        lines_drawn += 1
-
-        # Update pos for next lines
-        pos += cell_size + minor_grid_size
-        if lines_drawn % 2 == 0:
-            pos += cell_size + major_grid_size
+    for pos in grid.minor_lines:
+        pygame.draw.line(surface, black, (pos, start),
+                         (pos, end), minor_grid_size)
+        pygame.draw.line(surface, black, (start, pos),
+                         (end, pos), minor_grid_size)
 
     # Draw major grid lines
-    for pos in range(buffer+major_grid_size//2, width, cell_size*3 + minor_grid_size*2 + major_grid_size):
-        pygame.draw.line(screen, black, (pos, buffer),
-                         (pos, width-buffer-1), major_grid_size)
-        pygame.draw.line(screen, black, (buffer, pos),
-                         (width-buffer-1, pos), major_grid_size)
+    for pos in grid.major_lines:
+        pygame.draw.line(surface, black, (pos, start),
+                         (pos, end), major_grid_size)
+        pygame.draw.line(surface, black, (start, pos),
+                         (end, pos), major_grid_size)
 
 
-def fill_cells(cells, board):
-    '''Fills in all the numbers for the game.'''
-    font = pygame.font.Font(None, 36)
-
-    # Fill in all cells with correct value
-    for row in range(9):
-        for col in range(9):
-            if board.board[row][col].value is None:
-                continue
-
-            # Fill in given values
-            if not board.board[row][col].editable:
-                font.bold = True
-                text = font.render(f'{board.board[row][col].value}', 1, black)
+def cell_style(game, row, col):
+    '''
+    Returns how the value of a cell should be drawn: None if the cell is empty,
+    'given' for default values and 'valid' or 'conflict' for user entries.
+    '''
+    cell = game.board[row][col]
+    if cell.value is None:
+        return None
+    if not cell.editable:
+        return 'given'
+    if game.is_conflicting(cell):
+        return 'conflict'
+    return 'valid'
 
-            # Fill in values entered by user
-            else:
-                font.bold = False
-                if board.check_move(board.board[row][col], board.board[row][col].value):
-                    text = font.render(
-                        f'{board.board[row][col].value}', 1, green)
-                else:
-                    text = font.render(
-                        f'{board.board[row][col].value}', 1, red)
 
-            # Center text in cell
-            xpos, ypos = cells[row][col].center
-            textbox = text.get_rect(center=(xpos, ypos))
-            screen.blit(text, textbox)
+def draw_cell(surface, rect, value, style, background=None, outline=None, marks=0):
+    '''
+    Draws the value of a single cell, filling in its background first and
+    outlining the cell afterwards if those colors are given. An empty cell
+    shows the digits of the marks bitmask as pencil marks in a 3x3 grid.
+    '''
+    if background is not None:
+        pygame.draw.rect(surface, background, rect)
+    if outline is not None:
+        pygame.draw.rect(surface, outline, rect, 5)
+    if value is None:
+        third = rect.width // 3
+        for digit in DIGITS_OF[marks]:
+            row, col = divmod(digit - 1, 3)
+            center = (rect.left + third*col + third//2, rect.top + third*row + third//2)
+            text = glyphs.mark(digit)
+            surface.blit(text, text.get_rect(center=center))
+        return
+
+    text = glyphs.digit(value, style)
+
+    # Center text in cell
+    textbox = text.get_rect(center=rect.center)
+    surface.blit(text, textbox)
+
+
+def fill_cells(surface, cells, board):
+    '''Fills in all the numbers for the game.'''
+    for row in range(len(cells)):
+        for col in range(len(cells)):
+            draw_cell(
+                surface,
+                cells[row][col],
+                board.board[row][col].value,
+                cell_style(board, row, col)
+            )
 
 
-def draw_button(left, top, width, height, border, color, border_color, text):
+def draw_button(surface, left, top, width, height, border, color, border_color, text):
     '''Creates a button with a border.'''
     # Draw the border as outer rect
     pygame.draw.rect(
-        screen,
+        surface,
         border_color,
         (left, top, width+border*2, height+border*2),
     )
@@ -147,115 +230,255 @@ def draw_button(left, top, width, height, border, color, border_color, text):
         width,
         height
     )
-    pygame.draw.rect(screen, color, button)
+    pygame.draw.rect(surface, color, button)
 
     # Set the text
-    font = pygame.font.Font(None, 26)
-    text = font.render(text, 1, black)
+    text = glyphs.text(text, black)
     xpos, ypos = button.center
     textbox = text.get_rect(center=(xpos, ypos))
-    screen.blit(text, textbox)
+    surface.blit(text, textbox)
 
     return button
 
 
-def draw_board(active_cell, cells, game):
+def draw_board(surface, active_cell, cells, game):
     '''Draws all elements making up the board.'''
     # Draw grid and cells
-    draw_grid()
+    draw_grid(surface, game.topology.box)
     if active_cell is not None:
-        pygame.draw.rect(screen, gray, active_cell)
+        pygame.draw.rect(surface, gray, active_cell)
 
     # Fill in cell values
-    fill_cells(cells, game)
+    fill_cells(surface, cells, game)
 
 
-def visual_solve(game, cells):
-    '''Solves the game while giving a visual representation of what is being done.'''
-    # Get first empty cell
-    cell = game.get_empty_cell()
+class DirtyRenderer:
+    '''
+    Retained-mode renderer that remembers what was last drawn in each region
+    of a surface and only redraws the regions whose state changed. The
+    surface can be the display, which then only has the changed regions
+    updated, or an offscreen pygame.Surface.
+    '''
 
-    # Solve is complete if cell is False
-    if not cell:
-        return True
+    def __init__(self, surface, box=3):
+        '''
+        Initializes a renderer drawing a board with the given box size on
+        surface that redraws everything on the first frame.
+        '''
+        self.surface = surface
+        self.box = box
+        self.drawn = {}
+        self.dirty = []
+        self.invalidate()
+
+    def invalidate(self):
+        '''Forces the whole surface to be redrawn on the next frame.'''
+        self.drawn.clear()
+        self.stale = True
+
+    def region(self, key, rect, state, draw, *args):
+        '''Calls draw(*args) and marks rect dirty if the state of key changed.'''
+        if key in self.drawn and self.drawn[key] == state:
+            return
+        draw(*args)
+        self.drawn[key] = state
+        self.dirty.append(rect)
+
+    def begin(self):
+        '''Draws the static background if the surface was invalidated.'''
+        if self.stale:
+            self.draw_background()
+            self.dirty = [self.surface.get_rect()]
+            self.stale = False
+
+    def draw_background(self):
+        '''Draws what does not change between frames, the empty board.'''
+        self.surface.fill(white)
+        draw_grid(self.surface, self.box)
+
+    def flush(self):
+        '''Pushes the dirty regions to the display if drawing on it.'''
+        if self.dirty:
+            if self.surface is pygame.display.get_surface():
+                pygame.display.update(self.dirty)
+            self.dirty = []
+
+
+def draw_status(surface, rect, text, color):
+    '''Draws a status message centered in rect, clearing the previous one.'''
+    pygame.draw.rect(surface, white, rect)
+    if text:
+        text = glyphs.text(text, color, status=True)
+        textbox = text.get_rect(center=rect.center)
+
+        # Long hints are cut off at the edges of the status strip
+        surface.set_clip(rect)
+        surface.blit(text, textbox)
+        surface.set_clip(None)
+
+
+def draw_cells(renderer, cells, game, indices, active_cell=None, highlight=None, hint=None,
+               candidates=None):
+    '''
+    Redraws the cells at indices whose state changed. The active cell is
+    shaded, highlight is an (index, color, value) tuple outlining one cell and
+    showing value in it in the conflict style if value is not None, the cells
+    a hint Deduction was deduced from are shaded and the cells it changes are
+    outlined, and the candidates of a CandidateGrid are shown as pencil marks.
+    '''
+    size = game.topology.size
+    hint_cells = set(hint.cells) if hint is not None else ()
+    hint_targets = {index for index, _ in hint.placements + hint.eliminations} if hint is not None else ()
+    for index in indices:
+        row, col = divmod(index, size)
+        rect = cells[row][col]
+        value = game.board[row][col].value
+        style = cell_style(game, row, col)
+        marks = candidates.candidates[index] if candidates is not None else 0
+        if rect is active_cell:
+            background = gray
+        elif index in hint_cells:
+            background = hint_background
+        else:
+            background = white
+        if highlight is not None and highlight[0] == index:
+            outline = highlight[1]
+            if highlight[2] is not None:
+                value, style = highlight[2], 'conflict'
+        elif index in hint_targets:
+            outline = blue
+        else:
+            outline = None
+        renderer.region((row, col), rect, (value, style, background, outline, marks),
+                        draw_cell, renderer.surface, rect, value, style, background, outline, marks)
+
+
+def button_rect(key):
+    '''Returns the rect of a button inside its border.'''
+    return pygame.Rect(
+        button_lefts[key] + button_border,
+        button_top + button_border,
+        button_width,
+        button_height
+    )
 
-    # Check each possible move
-    for val in range(1, 10):
-        # Allow game to quit when being solved
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                sys.exit()
 
-        # Place value in board
-        cell.value = val
-
-        # Outline cell being changed in red
-        screen.fill(white)
-        draw_board(None, cells, game)
-        cell_rect = cells[cell.row][cell.col]
-        pygame.draw.rect(screen, red, cell_rect, 5)
-        pygame.display.update([cell_rect])
-        time.sleep(0.05)
-
-        # Check if the value is a valid move
-        if not game.check_move(cell, val):
-            cell.value = None
-            continue
-
-        # If all recursive calls return True then board is solved
-        screen.fill(white)
-        pygame.draw.rect(screen, green, cell_rect, 5)
-        draw_board(None, cells, game)
-        pygame.display.update([cell_rect])
-        if visual_solve(game, cells):
-            return True
-
-        # Undo move is solve was unsuccessful
-        cell.value = None
-
-    # No moves were successful
-    screen.fill(white)
-    pygame.draw.rect(screen, white, cell_rect, 5)
-    draw_board(None, cells, game)
-    pygame.display.update([cell_rect])
-    return False
-
-
-def check_sudoku(sudoku):
+def draw_buttons(renderer, labels, mouse_pos=None):
     '''
-    Takes a complete instance of Soduku and 
-    returns whether or not the solution is valid.
+    Redraws the buttons whose label or hover state changed. labels maps the
+    key of each button to draw to its text.
     '''
-    # Ensure all cells are filled
-    if sudoku.get_empty_cell():
-        raise ValueError('Game is not complete')
+    for key, text in labels.items():
+        button = button_rect(key)
+        color = active_btn if mouse_pos is not None and button.collidepoint(mouse_pos) else inactive_btn
+        outline = button.inflate(button_border*2, button_border*2)
+        renderer.region(key, outline, (color, text), draw_button, renderer.surface, button_lefts[key],
+                        button_top, button_width, button_height, button_border, color, black, text)
 
-    # Will hold values for each row, column, and box
-    row_sets = [set() for _ in range(9)]
-    col_sets = [set() for _ in range(9)]
-    box_sets = [set() for _ in range(9)]
 
-    # Check all rows, columns, and boxes contain no duplicates
-    for row in range(9):
-        for col in range(9):
-            box = (row // 3) * 3 + col // 3
-            value = sudoku.board[row][col].value
+def draw_status_strip(renderer, game, text=''):
+    '''Redraws the status strip, which shows text until the game is complete.'''
+    if game.is_complete():
+        text, color = 'Solved!', green
+    else:
+        color = black
+    rect = pygame.Rect(status_area)
+    renderer.region('status', rect, (text, color), draw_status, renderer.surface, rect, text, color)
 
-            # Check if number already encountered in row, column, or box
-            if value in row_sets[row] or value in col_sets[col] or value in box_sets[box]:
-                return False
 
-            # Add value to corresponding set
-            row_sets[row].add(value)
-            col_sets[col].add(value)
-            box_sets[box].add(value)
+def get_events(block):
+    '''Returns the pending events, waiting for at least one if block is True.'''
+    if block:
+        return [pygame.event.wait()] + pygame.event.get()
+    return pygame.event.get()
 
-    # All rows, columns, and boxes are valid
-    return True
 
+class VisualSolve:
+    '''
+    Runs Sudoku.solve_steps a number of steps per frame so the board can be
+    drawn while it is being solved. The solve can be paused, stepped, sped up,
+    skipped to the end or cancelled.
+    '''
 
-def play():
-    '''Contains all the functionality for playing a game of Sudoku.'''
+    fps = 20
+    max_speed = 4096
+    skip_timeout = 2.0
+
+    def __init__(self, game):
+        '''Starts a visual solve of game from its current state.'''
+        self.game = game
+        self.start = game.snapshot()
+        self.steps = game.solve_steps()
+        self.speed = 1
+        self.paused = False
+        self.done = False
+        self.highlight = None
+
+    def advance(self, count):
+        '''
+        Consumes up to count steps, highlighting the cell of the last one
+        along with the digit it rejected, if any.
+        '''
+        for _ in range(count):
+            step = next(self.steps)
+            if step.kind in ('solved', 'failed'):
+                self.finish()
+                return
+            if step.kind == 'place':
+                self.highlight = (step.index, green, None)
+            elif step.kind == 'reject':
+                self.highlight = (step.index, red, step.value)
+            else:
+                self.highlight = None
+
+    def update(self):
+        '''Advances the solve by one frame unless it is paused.'''
+        if not self.paused and not self.done:
+            self.advance(self.speed)
+
+    def step(self):
+        '''Advances a paused solve by a single step.'''
+        if self.paused and not self.done:
+            self.advance(1)
+
+    def faster(self):
+        '''Doubles the number of steps taken per frame.'''
+        self.speed = min(self.speed * 2, self.max_speed)
+
+    def slower(self):
+        '''Halves the number of steps taken per frame.'''
+        self.speed = max(self.speed // 2, 1)
+
+    def skip(self):
+        '''
+        Jumps straight to the end by solving from the starting state with the
+        fast engine. The board is left at the starting state if that fails or
+        takes longer than skip_timeout seconds.
+        '''
+        self.game.restore(self.start)
+        self.game.solve_within(timeout=self.skip_timeout)
+        self.finish()
+
+    def cancel(self):
+        '''Stops the solve and puts the board back the way it was.'''
+        self.game.restore(self.start)
+        self.finish()
+
+    def finish(self):
+        '''Marks the solve as done and releases the step generator.'''
+        self.done = True
+        self.highlight = None
+        self.steps.close()
+
+
+def play(difficulty=None, puzzle=None, save_path='sudoku.sav', load=False):
+    '''
+    Contains all the functionality for playing a game of Sudoku.
+    If a difficulty is given the board is taken from the puzzle pool, and if
+    a puzzle string is given the board is read from it, which also allows
+    4x4, 16x16 and 25x25 boards. Ctrl+S saves the game to save_path, and if
+    load is True the game saved there is played instead.
+    '''
     easy = [
         [0, 0, 0, 9, 0, 0, 0, 3, 0],
         [3, 0, 6, 0, 2, 0, 0, 4, 0],
@@ -267,159 +490,216 @@ def play():
         [7, 6, 3, 0, 0, 5, 4, 0, 0],
         [9, 2, 8, 0, 0, 4, 0, 0, 1]
     ]
-    game = Sudoku(easy)
-    cells = create_cells()
+    saved = None
+    if load:
+        with open(save_path, 'rb') as file:
+            saved = load_game(file.read())
+        game = saved.game
+    elif puzzle is not None:
+        game = Sudoku.from_string(puzzle)
+    elif difficulty is not None:
+        game = Sudoku.from_string(PuzzlePool().take(difficulty))
+    else:
+        game = Sudoku(easy)
+    box, size = game.topology.box, game.topology.size
+    renderer = DirtyRenderer(open_window(), box)
+    grid = geometry(box)
+    cells = grid.cells
+    glyphs.ensure(grid.cell_size, digit_colors, size)
     active_cell = None
-    solve_rect = pygame.Rect(
-        buffer,
-        height-button_height - button_border*2 - buffer,
-        button_width + button_border*2,
-        button_height + button_border*2
-    )
+
+    # Buttons keep the same position for the whole game
+    hint_btn = button_rect('hint')
+    reset_btn = button_rect('reset')
+    solve_btn = button_rect('solve')
+
+    # Cells whose value or conflict state may have changed since the last frame
+    peers = grid.topology.peers
+    changed_cells = set(range(game.topology.cells))
+    game.subscribe(lambda index, old, new: changed_cells.update(peers[index], (index,)))
+    drawn_active = None
+
+    # Candidates kept up to date with every edit for the pencil marks and
+    # hints, which the logical techniques only support on the 9x9 board
+    candidates = None
+    if size == 9:
+        candidates = CandidateGrid(game.values)
+        if saved is not None and saved.eliminated is not None:
+            for index, mask in enumerate(saved.eliminated):
+                for digit in DIGITS_OF[mask]:
+                    candidates.eliminate(index, digit)
+        game.subscribe(lambda index, old, new: candidates.set_value(index, new))
+    show_marks = True
+
+    # Last hint shown, cleared by the next edit
+    hint = None
+    status = ''
+
+    def clear_hint(*_):
+        '''Removes the hint from the board and the status strip.'''
+        nonlocal hint, status
+        if hint is not None:
+            changed_cells.update(hint.cells, (index for index, _ in hint.eliminations))
+        hint = None
+        status = ''
+
+    game.subscribe(clear_hint)
+
+    # Every move is recorded so it can be undone, a reset or a visual solve as one move
+    history = saved.history if saved is not None and saved.history is not None else History(game)
+
+    # Visual solve in progress, if any, and the cell it last highlighted
+    solving = None
+    drawn_highlight = None
+    clock = pygame.time.Clock()
 
     while True:
-        for event in pygame.event.get():
+        animating = solving is not None and not solving.paused
+        for event in get_events(block=not animating):
             if event.type == pygame.QUIT:
                 sys.exit()
 
+            # Solve controls while a visual solve is running
+            if solving is not None:
+                if event.type == pygame.KEYUP:
+                    if event.key == pygame.K_SPACE:
+                        solving.paused = not solving.paused
+                    if event.key == pygame.K_RIGHT:
+                        solving.step()
+                    if event.key == pygame.K_UP:
+                        solving.faster()
+                    if event.key == pygame.K_DOWN:
+                        solving.slower()
+                    if event.key == pygame.K_END:
+                        solving.skip()
+                    if event.key == pygame.K_ESCAPE:
+                        solving.cancel()
+                if event.type == pygame.MOUSEBUTTONUP and solve_btn.collidepoint(event.pos):
+                    solving.cancel()
+                continue
+
             # Handle mouse click
             if event.type == pygame.MOUSEBUTTONUP:
                 mouse_pos = pygame.mouse.get_pos()
 
                 # Reset button is pressed
                 if reset_btn.collidepoint(mouse_pos):
-                    game.reset()
+                    with history.group():
+                        game.reset()
+
+                # Hint button is pressed
+                if hint_btn.collidepoint(mouse_pos):
+                    clear_hint()
+                    if candidates is None:
+                        status = 'Hints are only available on 9x9 boards'
+                    elif game.conflicts:
+                        status = 'Fix the conflicts first'
+                    else:
+                        hint = next_deduction(candidates)
+                        if hint is None:
+                            status = 'No hint found'
+                        else:
+                            # Eliminations are kept so the next hint builds on them
+                            candidates.apply(hint._replace(placements=()))
+                            changed_cells.update(hint.cells, (index for index, _ in hint.eliminations))
+                            status = describe(hint)
 
                 # Solve button is pressed
                 if solve_btn.collidepoint(mouse_pos):
-                    screen.fill(white)
-                    active_cell = None
-                    draw_board(active_cell, cells, game)
-                    reset_btn = draw_button(
-                        width - buffer - button_border*2 - button_width,
-                        height - button_height - button_border*2 - buffer,
-                        button_width,
-                        button_height,
-                        button_border,
-                        inactive_btn,
-                        black,
-                        'Reset'
-                    )
-                    solve_btn = draw_button(
-                        width - buffer*2 - button_border*4 - button_width*2,
-                        height - button_height - button_border*2 - buffer,
-                        button_width,
-                        button_height,
-                        button_border,
-                        inactive_btn,
-                        black,
-                        'Visual Solve'
-                    )
-                    pygame.display.flip()
-                    visual_solve(game, cells)
-
-                # Test if point in any cell
-                active_cell = None
-                for row in cells:
-                    for cell in row:
-                        if cell.collidepoint(mouse_pos):
-                            active_cell = cell
+                    history.begin()
+                    solving = VisualSolve(game)
+
+                # Find the cell under the point, if any
+                active_cell = grid.cell_at(mouse_pos)
 
                 # Test if active cell is empty
                 if active_cell and not game.board[active_cell.row][active_cell.col].editable:
                     active_cell = None
-
             # Handle key press
             if event.type == pygame.KEYUP:
-                if active_cell is not None:
-
-                    # Input number based on key press
-                    if event.key == pygame.K_0 or event.key == pygame.K_KP0:
-                        game.board[active_cell.row][active_cell.col].value = 0
-                    if event.key == pygame.K_1 or event.key == pygame.K_KP1:
-                        game.board[active_cell.row][active_cell.col].value = 1
-                    if event.key == pygame.K_2 or event.key == pygame.K_KP2:
-                        game.board[active_cell.row][active_cell.col].value = 2
-                    if event.key == pygame.K_3 or event.key == pygame.K_KP3:
-                        game.board[active_cell.row][active_cell.col].value = 3
-                    if event.key == pygame.K_4 or event.key == pygame.K_KP4:
-                        game.board[active_cell.row][active_cell.col].value = 4
-                    if event.key == pygame.K_5 or event.key == pygame.K_KP5:
-                        game.board[active_cell.row][active_cell.col].value = 5
-                    if event.key == pygame.K_6 or event.key == pygame.K_KP6:
-                        game.board[active_cell.row][active_cell.col].value = 6
-                    if event.key == pygame.K_7 or event.key == pygame.K_KP7:
-                        game.board[active_cell.row][active_cell.col].value = 7
-                    if event.key == pygame.K_8 or event.key == pygame.K_KP8:
-                        game.board[active_cell.row][active_cell.col].value = 8
-                    if event.key == pygame.K_9 or event.key == pygame.K_KP9:
-                        game.board[active_cell.row][active_cell.col].value = 9
-                    if event.key == pygame.K_BACKSPACE or event.key == pygame.K_DELETE:
-                        game.board[active_cell.row][active_cell.col].value = None
-
-        screen.fill(white)
-
-        # Draw board
-        draw_board(active_cell, cells, game)
-
-        # Create buttons
-        reset_btn = draw_button(
-            width - buffer - button_border*2 - button_width,
-            height - button_height - button_border*2 - buffer,
-            button_width,
-            button_height,
-            button_border,
-            inactive_btn,
-            black,
-            'Reset'
-        )
-        solve_btn = draw_button(
-            width - buffer*2 - button_border*4 - button_width*2,
-            height - button_height - button_border*2 - buffer,
-            button_width,
-            button_height,
-            button_border,
-            inactive_btn,
-            black,
-            'Visual Solve'
-        )
-
-        # Check if mouse over either button
-        if reset_btn.collidepoint(pygame.mouse.get_pos()):
-            reset_btn = draw_button(
-                width - buffer - button_border*2 - button_width,
-                height - button_height - button_border*2 - buffer,
-                button_width,
-                button_height,
-                button_border,
-                active_btn,
-                black,
-                'Reset'
-            )
-        if solve_btn.collidepoint(pygame.mouse.get_pos()):
-            solve_btn = draw_button(
-                width - buffer*2 - button_border*4 - button_width*2,
-                height - button_height - button_border*2 - buffer,
-                button_width,
-                button_height,
-                button_border,
-                active_btn,
-                black,
-                'Visual Solve'
-            )
-
-        # Check if game is complete
-        if not game.get_empty_cell():
-            if check_sudoku(game):
-                # Set the text
-                font = pygame.font.Font(None, 36)
-                text = font.render('Solved!', 1, green)
-                textbox = text.get_rect(center=(solve_rect.center))
-                screen.blit(text, textbox)
-
-        # Update screen
-        pygame.display.flip()
+                # Input number based on key press, the letters are the digits above 9
+                if (
+                    active_cell is not None and event.key in value_keys
+                    and (value_keys[event.key] or 0) <= size
+                ):
+                    game.board[active_cell.row][active_cell.col].value = value_keys[event.key]
+
+                # Undo with Ctrl+Z and redo with Ctrl+Y or Ctrl+Shift+Z
+                elif event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL:
+                    if event.mod & pygame.KMOD_SHIFT:
+                        history.redo()
+                    else:
+                        history.undo()
+                elif event.key == pygame.K_y and event.mod & pygame.KMOD_CTRL:
+                    history.redo()
+
+                # Save the game with its pencil marks and history
+                elif event.key == pygame.K_s and event.mod & pygame.KMOD_CTRL:
+                    eliminated = candidates.eliminated if candidates is not None else None
+                    with open(save_path, 'wb') as file:
+                        file.write(save_game(game, eliminated, history))
+                    status = f'Saved to {save_path}'
+
+                # Toggle pencil marks
+                elif event.key == pygame.K_p:
+                    show_marks = not show_marks
+                    changed_cells.update(range(game.topology.cells))
+
+        # Run this frame's share of the visual solve
+        if solving is not None:
+            active_cell = None
+            solving.update()
+            highlight = solving.highlight
+            if solving.done:
+                solving = None
+                history.end()
+        else:
+            highlight = None
+
+        if renderer.stale:
+            changed_cells.update(range(game.topology.cells))
+        renderer.begin()
+
+        # Redraw the cells that changed, the old and new active cell and the old and new highlight
+        for rect in (drawn_active, active_cell):
+            if rect is not None:
+                changed_cells.add(rect.row * size + rect.col)
+        for marked in (drawn_highlight, highlight):
+            if marked is not None:
+                changed_cells.add(marked[0])
+        drawn_active = active_cell
+        drawn_highlight = highlight
+        draw_cells(renderer, cells, game, changed_cells, active_cell, highlight, hint,
+                   candidates if show_marks else None)
+        changed_cells.clear()
+
+        # Redraw the buttons when the mouse moves on or off them
+        draw_buttons(renderer, {
+            'solve': 'Cancel' if solving is not None else 'Visual Solve',
+            'reset': 'Reset',
+            'hint': 'Hint',
+        }, pygame.mouse.get_pos())
+
+        # Show the hint or whether the game is complete
+        draw_status_strip(renderer, game, status)
+
+        # Update only the changed parts of the screen
+        renderer.flush()
+        if solving is not None and not solving.paused:
+            clock.tick(VisualSolve.fps)
 
 
 if __name__ == '__main__':
-    play()
+    argument = sys.argv[1] if len(sys.argv) > 1 else None
+    if argument is None or argument in DIFFICULTIES:
+        play(argument)
+    elif os.path.isfile(argument) and is_collection(argument):
+        # A puzzle of a collection, picked by index or at random
+        with PuzzleCollection(argument) as collection:
+            index = int(sys.argv[2]) if len(sys.argv) > 2 else random.randrange(len(collection))
+            puzzle = collection[index]
+        play(puzzle=puzzle)
+    elif os.path.isfile(argument):
+        play(save_path=argument, load=True)
+    else:
+        play(puzzle=argument)
@@ -0,0 +1,58 @@
+import unittest
+from history import History
+from solver import Sudoku
+from storage import GAME_HEADER, GAME_MAGIC, load_game, pack_values, save_game
+
+
+PUZZLE = '..53.....8......2..7..1.5..4....53...1..7...6..32...8..6.5....9..4....3......97..'
+
+
+class LoadGameTest(unittest.TestCase):
+    '''Checks that load_game rejects saves that were cut short or added to.'''
+
+    def saves(self):
+        '''Returns saves of the same game with every combination of marks and history.'''
+        game = Sudoku.from_string(PUZZLE)
+        history = History(game)
+        game.set_value(0, 1)
+        game.set_value(1, 4)
+        eliminated = [0] * 81
+        eliminated[2] = 0b110
+        return [
+            save_game(game),
+            save_game(game, eliminated),
+            save_game(game, None, history),
+            save_game(game, eliminated, history),
+        ]
+
+    def test_round_trip(self):
+        for data in self.saves():
+            saved = load_game(data)
+            self.assertEqual(saved.game.values[:2], bytes([1, 4]))
+            self.assertEqual(saved.game.givens, Sudoku.from_string(PUZZLE).givens)
+
+    def test_truncated(self):
+        for data in self.saves():
+            for cut in range(1, len(data)):
+                with self.subTest(length=len(data), cut=cut):
+                    with self.assertRaises(ValueError):
+                        load_game(data[:-cut])
+
+    def test_extended(self):
+        for data in self.saves():
+            for extra in (b'\0', b'\0' * 4, b'\xff' * 40):
+                with self.subTest(length=len(data), extra=len(extra)):
+                    with self.assertRaises(ValueError):
+                        load_game(data + extra)
+
+    def test_entry_over_given(self):
+        game = Sudoku.from_string(PUZZLE)
+        entries = [0] * 81
+        entries[2] = 5
+        data = GAME_HEADER.pack(GAME_MAGIC, 81, 0) + pack_values(game.givens) + pack_values(entries)
+        with self.assertRaises(ValueError):
+            load_game(data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,411 @@
+import argparse
+import queue
+import random
+import sys
+import threading
+import time
+import pygame
+import sudoku
+from batch_solve import read_puzzles
+from layout import caption_height, layout_tiles
+from solver import Sudoku
+from storage import PuzzleCollection, is_collection
+
+
+class Player:
+    '''A player of a tournament: their name, board and the moves they made.'''
+
+    __slots__ = ('name', 'game', 'moves', 'mistakes', 'finished')
+
+    def __init__(self, name, game):
+        self.name = name
+        self.game = game
+        self.moves = 0
+        self.mistakes = 0
+        self.finished = None
+
+
+class Tournament:
+    '''
+    The boards of every player in a timed tournament, all of the same size.
+    Moves may be submitted from any thread and are applied by the thread
+    drawing the boards. Every move is validated when it is applied, and the
+    conflicts of a board are updated incrementally by Sudoku.set_value,
+    which only checks the units of the changed cell.
+    '''
+
+    def __init__(self, puzzles, names=None):
+        '''
+        Starts a tournament with a board for every puzzle string. Players
+        are named by names if given, otherwise they are numbered.
+        '''
+        self.players = []
+        for number, puzzle in enumerate(puzzles):
+            name = names[number] if names is not None else f'Player {number + 1}'
+            self.players.append(Player(name, Sudoku.from_string(puzzle)))
+        if not self.players:
+            raise ValueError('A tournament needs at least one board.')
+        self.topology = self.players[0].game.topology
+        if any(player.game.topology is not self.topology for player in self.players):
+            raise ValueError('Every board of a tournament must have the same size.')
+        self.queue = queue.SimpleQueue()
+        self.start = time.monotonic()
+        self.rejected = 0
+
+    def __len__(self):
+        return len(self.players)
+
+    def submit(self, player, index, value):
+        '''Queues a move of the player at a position, value 0 clears the cell. Thread safe.'''
+        self.queue.put((player, index, value))
+
+    def apply(self, player, index, value):
+        '''
+        Applies a move of the player at a position. Raises ValueError for an
+        unknown player, a cell that is not on the board or is a given, or a
+        value that is not a digit of the board. Returns whether the move
+        conflicts with another cell.
+        '''
+        if not 0 <= player < len(self.players):
+            raise ValueError(f'No player {player} in the tournament.')
+        entry = self.players[player]
+        game = entry.game
+        if not 0 <= index < self.topology.cells:
+            raise ValueError(f'Cell {index} is not on the board.')
+        if game.givens[index]:
+            raise ValueError(f'Cell {index} is a given.')
+        if not 0 <= value <= self.topology.size:
+            raise ValueError(f'Value must be between 0 and {self.topology.size}.')
+
+        game.set_value(index, value)
+        entry.moves += 1
+        conflicting = index in game.conflicts
+        if conflicting:
+            entry.mistakes += 1
+        if entry.finished is None and game.is_complete():
+            entry.finished = time.monotonic() - self.start
+        return conflicting
+
+    def drain(self, limit=None):
+        '''
+        Applies up to limit queued moves, all of them by default, counting
+        the invalid ones in rejected. Returns the number of moves taken off
+        the queue.
+        '''
+        count = 0
+        while limit is None or count < limit:
+            try:
+                move = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            count += 1
+            try:
+                self.apply(*move)
+            except ValueError:
+                self.rejected += 1
+        return count
+
+    def standings(self):
+        '''Returns the players ordered by finishing time, then by the most cells filled in.'''
+        return sorted(
+            self.players,
+            key=lambda player: (player.finished is None, player.finished or 0, -player.game.filled)
+        )
+
+
+class TileRenderer(sudoku.DirtyRenderer):
+    '''
+    Draws every board of a tournament as a scaled tile with a caption. The
+    tiles share one pre-rendered empty board and the digit glyphs, and only
+    the cells of boards that changed since the last frame are redrawn. The
+    cell changed last on every board is shaded.
+    '''
+
+    def __init__(self, surface, tournament):
+        '''Lays out the tiles of a tournament on surface and watches its boards for changes.'''
+        self.tournament = tournament
+        topology = tournament.topology
+        self.grid, self.tiles = layout_tiles(len(tournament), topology.box, *surface.get_size())
+        self.caption_font = pygame.font.Font(None, caption_height + 2)
+
+        # Small cells need digits that fill more of the cell to stay readable
+        cell_size = self.grid.cell_size
+        sudoku.glyphs.ensure(cell_size, sudoku.digit_colors, topology.size, cell_size * 5 // 4)
+
+        # Every tile is blitted from the same empty board
+        extent = self.grid.end + 1
+        self.board = pygame.Surface((extent, extent))
+        self.board.fill(sudoku.white)
+        sudoku.draw_grid(self.board, grid=self.grid)
+
+        self.cell_rects = []
+        self.captions = []
+        for left, top in self.tiles:
+            self.captions.append(pygame.Rect(left, top, extent, caption_height))
+            self.cell_rects.append([pygame.Rect(rect).move(left, top + caption_height) for rect in self.grid.rects])
+
+        # Cells of every board whose value or conflict state may have changed
+        self.changed = [set() for _ in self.tiles]
+        self.changed_tiles = set()
+        self.last = [None] * len(self.tiles)
+        self.listeners = []
+        for tile, player in enumerate(tournament.players):
+            listener = self._listener(tile)
+            player.game.subscribe(listener)
+            self.listeners.append(listener)
+        super().__init__(surface, topology.box)
+
+    def _listener(self, tile):
+        '''Returns the listener marking the changed cells of the board of a tile.'''
+        peers = self.tournament.topology.peers
+        changed = self.changed[tile]
+        values = self.tournament.players[tile].game.values
+
+        def listener(index, old, new):
+            # Only peers holding the old or new digit can change their conflict state
+            changed.add(index)
+            changed.update([peer for peer in peers[index] if values[peer] and values[peer] in (old, new)])
+            if self.last[tile] is not None:
+                changed.add(self.last[tile])
+            self.last[tile] = index
+            self.changed_tiles.add(tile)
+
+        return listener
+
+    def close(self):
+        '''Stops watching the boards of the tournament.'''
+        for player, listener in zip(self.tournament.players, self.listeners):
+            player.game.unsubscribe(listener)
+
+    def draw_background(self):
+        '''Draws the empty board of every tile.'''
+        self.surface.fill(sudoku.white)
+        cells = range(self.tournament.topology.cells)
+        for tile, (left, top) in enumerate(self.tiles):
+            self.surface.blit(self.board, (left, top + caption_height))
+            self.changed[tile].update(cells)
+        self.changed_tiles.update(range(len(self.tiles)))
+
+    def draw(self):
+        '''Redraws the changed cells and captions of every tile.'''
+        self.begin()
+        for tile in self.changed_tiles:
+            start = len(self.dirty)
+            self.draw_tile(tile)
+
+            # One update rect per tile keeps the display updates cheap
+            if len(self.dirty) - start > 1:
+                self.dirty[start:] = [self.dirty[start].unionall(self.dirty[start + 1:])]
+        self.changed_tiles.clear()
+
+    def draw_tile(self, tile):
+        '''Redraws the changed cells and the caption of a tile.'''
+        player = self.tournament.players[tile]
+        game = player.game
+        values, givens, conflicts = game.values, game.givens, game.conflicts
+        rects = self.cell_rects[tile]
+        for index in self.changed[tile]:
+            value = values[index] or None
+            if value is None:
+                style = None
+            elif givens[index]:
+                style = 'given'
+            elif index in conflicts:
+                style = 'conflict'
+            else:
+                style = 'valid'
+            background = sudoku.hint_background if index == self.last[tile] else sudoku.white
+            rect = rects[index]
+            self.region((tile, index), rect, (value, style, background),
+                        sudoku.draw_cell, self.surface, rect, value, style, background)
+        self.changed[tile].clear()
+
+        if player.finished is not None:
+            minutes, seconds = divmod(int(player.finished), 60)
+            progress, color = f'{minutes}:{seconds:02}', sudoku.green
+        else:
+            progress = f'{game.filled * 100 // self.tournament.topology.cells}%'
+            color = sudoku.red if conflicts else sudoku.black
+        rect = self.captions[tile]
+        self.region((tile, 'caption'), rect, (progress, color), self.draw_caption,
+                    rect, player.name, progress, color)
+
+    def draw_caption(self, rect, name, progress, color):
+        '''Draws the caption of a tile, the name cut off where the progress starts.'''
+        pygame.draw.rect(self.surface, sudoku.white, rect)
+        progress = self.caption_font.render(progress, 1, color)
+        right = progress.get_rect(topright=rect.topright)
+        self.surface.blit(progress, right)
+        self.surface.set_clip(rect.clip((rect.left, rect.top, right.left - rect.left - 2, rect.height)))
+        self.surface.blit(self.caption_font.render(name, 1, sudoku.black), rect)
+        self.surface.set_clip(None)
+
+
+def run(tournament, screen, fps=30, moves_per_frame=5000, frames=None):
+    '''
+    Shows the boards of a tournament on screen, applying up to
+    moves_per_frame queued moves every frame so a burst of moves cannot
+    stall the display. Runs until the window is closed, Escape is pressed
+    or frames frames were drawn. Returns the seconds of work of every frame.
+    '''
+    renderer = TileRenderer(screen, tournament)
+    clock = pygame.time.Clock()
+    work = []
+    try:
+        while frames is None or len(work) < frames:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    return work
+                if event.type == pygame.KEYUP and event.key == pygame.K_ESCAPE:
+                    return work
+            start = time.perf_counter()
+            tournament.drain(moves_per_frame)
+            renderer.draw()
+            renderer.flush()
+            work.append(time.perf_counter() - start)
+            clock.tick(fps)
+    finally:
+        renderer.close()
+    return work
+
+
+def simulated_moves(game, mistake_rate, rng):
+    '''
+    Returns the (index, value) moves of a simulated player solving a game:
+    the empty cells in random order, sometimes with a wrong digit that is
+    corrected later.
+    '''
+    solution = game.copy()
+    solution.solve()
+    size = game.topology.size
+    empty = [index for index, value in enumerate(game.values) if not value]
+    rng.shuffle(empty)
+    wrong = []
+    moves = []
+    while empty or wrong:
+        if wrong and (not empty or rng.random() < 0.3):
+            index = wrong.pop()
+            moves.append((index, solution.values[index]))
+            continue
+        index = empty.pop()
+        if rng.random() < mistake_rate:
+            value = rng.choice([digit for digit in range(1, size + 1) if digit != solution.values[index]])
+            wrong.append(index)
+        else:
+            value = solution.values[index]
+        moves.append((index, value))
+    return moves
+
+
+def simulate(tournament, rate, mistake_rate=0.05, seed=None):
+    '''
+    Starts a daemon thread submitting the moves of simulated players to a
+    tournament, rate moves per second in total, until every board is solved.
+    The moves are worked out before the thread starts so it does not hold
+    up the display.
+    '''
+    rng = random.Random(seed)
+    players = {
+        number: iter(simulated_moves(player.game, mistake_rate, rng))
+        for number, player in enumerate(tournament.players)
+    }
+    interval = 0.01
+
+    def feed():
+        owed = 0.0
+        while players:
+            owed += rate * interval
+            while owed >= 1 and players:
+                owed -= 1
+                number = rng.choice(list(players))
+                move = next(players[number], None)
+                if move is None:
+                    del players[number]
+                else:
+                    tournament.submit(number, *move)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=feed, daemon=True)
+    thread.start()
+    return thread
+
+
+def read_moves(tournament, file):
+    '''
+    Starts a daemon thread submitting the moves read from a file, one
+    'player index value' line each with the player numbered from 0.
+    Malformed lines are counted as rejected moves.
+    '''
+    def feed():
+        for line in file:
+            try:
+                player, index, value = (int(field) for field in line.split())
+            except ValueError:
+                tournament.rejected += 1
+                continue
+            tournament.submit(player, index, value)
+
+    thread = threading.Thread(target=feed, daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv=None):
+    '''Command line entry point for showing a tournament.'''
+    parser = argparse.ArgumentParser(
+        description='Show the boards of many players of a tournament on one display.'
+    )
+    parser.add_argument('puzzles', help='puzzle file or collection, one board per puzzle')
+    parser.add_argument('-n', '--boards', type=int, default=None,
+                        help='number of boards, repeating the puzzles if needed (default: one per puzzle)')
+    parser.add_argument('-m', '--moves', default=None,
+                        help="file of 'player index value' moves, use '-' for stdin")
+    parser.add_argument('-s', '--simulate', type=float, default=None, metavar='RATE',
+                        help='simulate players making RATE moves per second in total')
+    parser.add_argument('--mistakes', type=float, default=0.05,
+                        help='share of simulated moves with a wrong digit (default: 0.05)')
+    parser.add_argument('--size', default='1280x720', help='window size (default: 1280x720)')
+    parser.add_argument('--fps', type=int, default=30, help='frames per second (default: 30)')
+    parser.add_argument('--frames', type=int, default=None,
+                        help='stop after this many frames and report the frame times')
+    parser.add_argument('--seed', type=int, default=None, help='random seed of the simulated players')
+    args = parser.parse_args(argv)
+
+    if is_collection(args.puzzles):
+        with PuzzleCollection(args.puzzles) as collection:
+            puzzles = list(collection)
+    else:
+        with open(args.puzzles) as file:
+            puzzles = list(read_puzzles(file))
+    if not puzzles:
+        parser.error(f'No puzzles in {args.puzzles}')
+    boards = args.boards or len(puzzles)
+    tournament = Tournament(puzzles[number % len(puzzles)] for number in range(boards))
+
+    width, height = (int(side) for side in args.size.split('x'))
+    pygame.display.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((width, height))
+    pygame.display.set_caption(f'Sudoku tournament, {boards} boards')
+
+    if args.simulate:
+        simulate(tournament, args.simulate, args.mistakes, args.seed)
+    if args.moves is not None:
+        read_moves(tournament, sys.stdin if args.moves == '-' else open(args.moves))
+
+    work = run(tournament, screen, args.fps, frames=args.frames)
+    if args.frames is not None and work:
+        work.sort()
+        print(
+            f'{len(work)} frames, median {work[len(work) // 2] * 1000:.2f} ms, '
+            f'slowest {work[-1] * 1000:.2f} ms of work per frame, '
+            f'{tournament.rejected} moves rejected',
+            file=sys.stderr
+        )
+    for place, player in enumerate(tournament.standings(), 1):
+        if player.finished is not None:
+            print(f'{place}. {player.name} {player.finished:.1f}s {player.mistakes} mistakes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+from collections import namedtuple
+import numpy as np
+
+
+# OR of the bits 1 << d for every digit d, the value of a complete unit
+_COMPLETE_UNIT = sum(1 << digit for digit in range(1, 10))
+
+UNIT_KINDS = ('row', 'col', 'box')
+
+BatchValidation = namedtuple('BatchValidation', ['valid', 'rows', 'cols', 'boxes'])
+BatchValidation.__doc__ = '''
+Result of validating a batch of N boards.
+valid is an (N,) boolean array and rows, cols and boxes are (N, 9) boolean
+arrays that are True where the unit holds each digit 1 to 9 exactly once.
+'''
+
+
+def validate_boards(boards):
+    '''
+    Validates an (N, 9, 9) array of complete boards in one vectorized pass.
+    Returns a BatchValidation with per board and per unit validity masks.
+    '''
+    boards = np.asarray(boards)
+    if boards.ndim == 2:
+        boards = boards[np.newaxis]
+    if boards.ndim != 3 or boards.shape[1:] != (9, 9):
+        raise ValueError('Boards must have shape (N, 9, 9).')
+
+    # Give every digit its own bit, anything outside 1 to 9 gets no bit
+    in_range = (boards >= 1) & (boards <= 9)
+    bits = np.left_shift(np.int16(1), np.where(in_range, boards, 0).astype(np.int16))
+    bits *= in_range
+
+    # Nine cells can only set all nine digit bits if each digit appears once
+    rows = np.bitwise_or.reduce(bits, axis=2) == _COMPLETE_UNIT
+    cols = np.bitwise_or.reduce(bits, axis=1) == _COMPLETE_UNIT
+    boxes = bits.reshape(-1, 3, 3, 3, 3).transpose(0, 1, 3, 2, 4).reshape(-1, 9, 9)
+    boxes = np.bitwise_or.reduce(boxes, axis=2) == _COMPLETE_UNIT
+
+    valid = rows.all(axis=1) & cols.all(axis=1) & boxes.all(axis=1)
+    return BatchValidation(valid, rows, cols, boxes)
+
+
+def conflicting_units(result):
+    '''
+    Returns a list of (board, kind, unit) tuples for every invalid unit in a
+    BatchValidation, where kind is 'row', 'col' or 'box'.
+    '''
+    conflicts = []
+    for kind, mask in zip(UNIT_KINDS, (result.rows, result.cols, result.boxes)):
+        for board, unit in zip(*np.nonzero(~mask)):
+            conflicts.append((int(board), kind, int(unit)))
+    conflicts.sort()
+    return conflicts